@@ -3,22 +3,31 @@ import streamlit as st
 from pathlib import Path
 import subprocess
 import sys
+import hashlib
 import json
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
 
 
 
-from data_connectors import get_credit_record, get_account_record, get_pr_status
-from manual_review_writer import write_manual_review_case
-from policy_rag import retrieve, build_or_load_index
-from decision_engine import call_gemini
-from audit_logger import write_audit
+from data_connectors import get_customer_profile
+from manual_review_writer import write_manual_review_case, count_cases, list_cases, get_case, case_file_name
+from policy_rag import retrieve, build_or_load_index, get_retriever, sync_policies, policy_rules, index_build_id
+from decision_engine import assess_stream, build_rag_query
+from llm_cache import get_cache
+from llm_executor import get_executor
+from metrics import get_metrics, span, start_metrics_server
+from audit_logger import AuditWriteError, write_audit
 from applicant_letter_generator import build_applicant_letter
 from decision_note import build_decision_note
-from pdf_utils import letter_text_to_pdf_bytes
+from pdf_utils import LETTER_PDF_TITLE, letter_text_to_pdf_bytes
 
 POLICY_DIR = Path(__file__).resolve().parent / "policies"
 POLICY_DIR.mkdir(exist_ok=True)
 
+# Prometheus /metrics for this server process when METRICS_PORT is set (started once)
+start_metrics_server()
+
 st.set_page_config(page_title="Loan Risk Assessment (GenAI)", layout="wide")
 
 st.title("Loan Risk Assessment")
@@ -60,6 +69,32 @@ def recommendation_badge(rec: str):
     }
     return mapping.get(rec, rec)
 
+# Results of recent "Assess" clicks, kept across reruns of this session
+MAX_ASSESSMENTS = 20
+
+def _sha256(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def save_uploaded_policies(uploaded_files) -> List[str]:
+    """
+    Write uploads to policies/, skipping files this session already saved
+    and files whose content is already on disk. Returns the names written.
+    """
+    saved = st.session_state.setdefault("uploaded_policy_hashes", {})
+    written = []
+    for f in uploaded_files:
+        data = f.getvalue()
+        digest = _sha256(data)
+        if saved.get(f.name) == digest:
+            continue
+        save_path = POLICY_DIR / f.name
+        if not (save_path.exists() and _sha256(save_path.read_bytes()) == digest):
+            with open(save_path, "wb") as out:
+                out.write(data)
+            written.append(f.name)
+        saved[f.name] = digest
+    return written
+
 with st.sidebar:
     st.sidebar.markdown("## Policy Management")
 
@@ -70,11 +105,12 @@ with st.sidebar:
     )
 
     if uploaded_files:
-        for f in uploaded_files:
-            save_path = POLICY_DIR / f.name
-            with open(save_path, "wb") as out:
-                out.write(f.getbuffer())
-        st.sidebar.success(f"Uploaded {len(uploaded_files)} file(s) to policies/")
+        written = save_uploaded_policies(uploaded_files)
+        if written:
+            changes = sync_policies()
+            st.sidebar.success(f"Uploaded {len(written)} file(s) to policies/")
+            if changes["added"] or changes["updated"]:
+                st.sidebar.caption(f"Indexed: {', '.join(changes['added'] + changes['updated'])}")
 
     # List policies
     policy_files = sorted([p.name for p in POLICY_DIR.glob("*.pdf")])
@@ -97,11 +133,32 @@ with st.sidebar:
         from policy_rag import rebuild_index
         rebuild_index()
         st.sidebar.success("Policy index rebuilt ✅")
-        
+
+    @st.fragment
+    def service_stats_panel():
+        with st.expander("Retrieval service stats"):
+            st.json(get_retriever().stats())
+
+        with st.expander("LLM decision cache"):
+            st.json(get_cache().stats())
+            st.caption("Gemini executor (rate limits / retries)")
+            st.json(get_executor().stats())
+            if st.button("Clear LLM cache"):
+                get_cache().clear()
+
+        with st.expander("Pipeline metrics"):
+            m = get_metrics().summary()
+            st.caption(f"Since {m['since']} (this server process)")
+            st.json({"cache_hit_rates": m["cache_hit_rates"], "histograms": m["histograms"], "counters": m["counters"]})
+
+    service_stats_panel()
+
     st.sidebar.markdown("### Manage Policies")
     to_delete = st.sidebar.selectbox("Select a policy to delete", ["(none)"] + policy_files)
     if to_delete != "(none)" and st.sidebar.button("Delete selected policy"):
         (POLICY_DIR / to_delete).unlink(missing_ok=True)
+        st.session_state.get("uploaded_policy_hashes", {}).pop(to_delete, None)
+        sync_policies()
         st.sidebar.success(f"Deleted: {to_delete}")
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -110,30 +167,101 @@ if not db_file.exists():
     # Auto-bootstrap DB if missing
     subprocess.check_call([sys.executable, str(BASE_DIR / "bootstrap_db.py")])
 
-customer_id = st.number_input("Customer ID", min_value=1, step=1, value=1111)
 
-if st.button("Assess Risk & Rate"):
-    credit = get_credit_record(int(customer_id))
-    acct = get_account_record(int(customer_id))
+def run_assessment(customer_id: int, policies: List[str], llm_rationale: bool,
+                   on_update: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    The expensive part of the page: lookup, retrieval, decision, audit and
+    correspondence. Runs once per "Assess" click; None if the customer isn't found.
+    on_update receives the decision fields as Gemini streams them.
+    """
+    # Credit, account and (for non-Singaporeans) PR status in one query
+    customer = get_customer_profile(int(customer_id))
+    if not customer:
+        return None
 
-    if not credit or not acct:
-        st.error("Customer not found in simulated systems DB.")
-        st.stop()
-
-    customer = {
-        "id": credit["id"],
-        "name": credit["name"],
-        "email": credit["email"],
-        "credit_score": credit["credit_score"],
-        "nationality": acct["nationality"],
-        "account_status": acct["account_status"],
+    # RAG query
+    rag_query = build_rag_query(customer)
+
+    # Filter inside the search so we still get the top 5 from the selected policies
+    evidence = retrieve(rag_query, k=5, sources=policies or None)
+
+    ## Policy rule table first; Gemini only for cases the tables don't cover
+    for update in assess_stream(customer, evidence, rules=policy_rules(policies or None),
+                                llm_rationale=llm_rationale, index_id=index_build_id()):
+        if on_update is not None and "result" not in update:
+            on_update(update)
+    result = update["result"]
+
+    # Synchronous: a decision isn't shown (or queued for review) until its audit record is on disk
+    audit_id = write_audit({
+        "customer": customer,
+        "rag_query": rag_query,
+        "evidence": evidence,
+        "result": result,
+    }, sync=True)
+
+    # If human review is needed, add it to the manual review queue
+    manual_case_id = None
+    if result.get("recommendation") == "needs_manual_review":
+        manual_case_id = write_manual_review_case(customer, result, evidence, rag_query)
+    return {
+        "customer": customer,
+        "rag_query": rag_query,
+        "evidence": evidence,
+        "result": result,
+        "audit_id": audit_id,
+        "manual_case_id": manual_case_id,
+        "decision_note": build_decision_note(customer, result, evidence),
+        "applicant_letter": build_applicant_letter(customer, result),
+        "applicant_letter_pdf": None,  # rendered on request
     }
 
-    # Conditional PR check
-    pr = None
-    if customer["nationality"].lower() != "singaporean":
-        pr = get_pr_status(int(customer_id))
-        customer["pr_status"] = pr
+
+def show_live_decision(placeholder, update: Dict[str, Any]):
+    """Decision fields while Gemini is still writing: finished fields shown, the rest pending."""
+    fields, partial = update["fields"], update["partial"]
+    with placeholder.container():
+        st.subheader("Loan Risk Assessment Result")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.metric("Overall Risk", risk_badge(fields["overall_risk"]) if "overall_risk" in fields else "…")
+        with c2:
+            st.metric("Interest Rate", fields.get("interest_rate", "…"))
+        with c3:
+            st.metric("Recommendation", recommendation_badge(fields["recommendation"]) if "recommendation" in fields else "…")
+        rationale = fields.get("rationale") or partial.get("rationale")
+        st.info(rationale if rationale else "Writing rationale…")
+
+
+@st.fragment
+def letter_downloads(assessment: Dict[str, Any]):
+    customer, applicant_letter = assessment["customer"], assessment["applicant_letter"]
+    colA, colB = st.columns(2)
+
+    with colA:
+        st.download_button(
+            label="Download applicant letter (.txt)",
+            data=applicant_letter.encode("utf-8"),
+            file_name=f"applicant_letter_{customer['id']}.txt",
+            mime="text/plain"
+        )
+
+    with colB:
+        # Rendered on request only, then kept with the assessment
+        if assessment["applicant_letter_pdf"] is None and st.button("Prepare applicant letter (PDF)"):
+            assessment["applicant_letter_pdf"] = letter_text_to_pdf_bytes(applicant_letter, title=LETTER_PDF_TITLE)
+        if assessment["applicant_letter_pdf"] is not None:
+            st.download_button(
+                label="Download applicant letter (PDF)",
+                data=assessment["applicant_letter_pdf"],
+                file_name=f"applicant_letter_{customer['id']}.pdf",
+                mime="application/pdf"
+            )
+
+
+def show_assessment(assessment: Dict[str, Any]):
+    customer, evidence, result = assessment["customer"], assessment["evidence"], assessment["result"]
 
     col1, col2 = st.columns(2)
 
@@ -173,26 +301,8 @@ if st.button("Assess Risk & Rate"):
         else:
             st.write(" PR Status check skipped (Singaporean)")
 
-
-    # RAG query
-    rag_query = f"""
-    Determine overall risk and interest rate for:
-    credit_score={customer['credit_score']},
-    account_status={customer['account_status']},
-    nationality={customer['nationality']},
-    pr_status={customer.get('pr_status')}
-    """
-
-    evidence = retrieve(rag_query, k=5)
-    if selected_policies:
-        evidence = [e for e in evidence if e.get("source") in selected_policies]
-
-    ## Gemini reasoning
-    result = call_gemini(customer, evidence)
-    # If human review is needed, write a separate case file
-    manual_case_path = None
-    if result.get("recommendation") == "needs_manual_review":
-        manual_case_path = write_manual_review_case(customer, result, evidence, rag_query)
+    if result.get("decided_by", "").startswith("policy_rules"):
+        st.caption("Risk and rate decided from the compiled policy tables")
 
     st.markdown("### Policy Evidence Used")
     for ev in result.get("evidence_used", []):
@@ -201,7 +311,7 @@ if st.button("Assess Risk & Rate"):
     
     with st.expander("View Retrieved Policy Snippets (RAG)"):
         for e in evidence:
-            st.markdown(f"**{e['chunk_id']}** (score={e['score']:.3f})")
+            st.markdown(f"**{e['chunk_id']}** (score={e['score']:.3f}, p.{e.get('page_start', '?')})")
             st.write(e["text"])
             st.markdown("---")
 
@@ -232,21 +342,14 @@ if st.button("Assess Risk & Rate"):
 
     st.info(result["rationale"])
 
-
-    audit_path = write_audit({
-        "customer": customer,
-        "rag_query": rag_query,
-        "evidence": evidence,
-        "result": result,
-    })
-    st.success(f"Audit saved: {audit_path}")
-    if manual_case_path:
-        st.warning(f"Sent to manual review queue: {manual_case_path}")
+    st.success(f"Audit recorded: {assessment['audit_id']} (audits/)")
+    if assessment["manual_case_id"]:
+        st.warning(f"Sent to manual review queue: case #{assessment['manual_case_id']}")
 
     with st.expander("Audit & Raw Model Output"):
         st.json(result) 
     with st.expander("Internal Audit Note:"):
-        decision_note = build_decision_note(customer, result, evidence)
+        decision_note = assessment["decision_note"]
         st.text_area(
             "Decision note:",
             decision_note,
@@ -261,130 +364,146 @@ if st.button("Assess Risk & Rate"):
         )
     st.markdown("### Applicant-Facing Letter (Formal Communication)")
 
-    applicant_letter = build_applicant_letter(customer, result)
-
     st.text_area(
         "Applicant letter (formal bank communication):",
-        applicant_letter,
+        assessment["applicant_letter"],
         height=320
     )
 
-    colA, colB = st.columns(2)
+    letter_downloads(assessment)
 
-    with colA:
-        st.download_button(
-            label="Download applicant letter (.txt)",
-            data=applicant_letter.encode("utf-8"),
-            file_name=f"applicant_letter_{customer['id']}.txt",
-            mime="text/plain"
-        )
 
-    with colB:
-        pdf_bytes = letter_text_to_pdf_bytes(
-            applicant_letter,
-            title="Applicant Letter — Loan Application Outcome"
-        )
-        st.download_button(
-            label="Download applicant letter (PDF)",
-            data=pdf_bytes,
-            file_name=f"applicant_letter_{customer['id']}.pdf",
-            mime="application/pdf"
-        )
+customer_id = st.number_input("Customer ID", min_value=1, step=1, value=1111)
+llm_rationale = st.checkbox("Ask Gemini to write the rationale (even when the policy tables decide)", value=False)
+
+def make_assessment_key(customer_id: int, policies: List[str], llm_rationale: bool) -> Optional[str]:
+    """Session key of an assessment; None while there is no policy index to key it on."""
+    try:
+        build_id = index_build_id()
+    except RuntimeError:  # no policy files / index yet
+        return None
+    return json.dumps([customer_id, sorted(policies), llm_rationale, build_id])
+
+
+# Other widgets only rerun the script; the pipeline itself runs on an explicit Assess click
+assessments: Dict[str, Dict[str, Any]] = st.session_state.setdefault("assessments", {})
+# The index is only touched here once something has been assessed (it is loaded by then)
+assessment_key = make_assessment_key(int(customer_id), selected_policies, llm_rationale) if assessments else None
+
+if st.button("Assess Risk & Rate"):
+    live = st.empty()
+    audit_error = None
+    try:
+        with span("assessment"):
+            assessment = run_assessment(int(customer_id), selected_policies, llm_rationale,
+                                        on_update=lambda update: show_live_decision(live, update))
+    except AuditWriteError as e:
+        assessment, audit_error = None, e
+    live.empty()
+    assessment_key = make_assessment_key(int(customer_id), selected_policies, llm_rationale)
+    assessments.pop(assessment_key, None)
+    if audit_error is not None:
+        st.error(f"The decision could not be saved to the audit log, so it is not shown: {audit_error}")
+    elif assessment is None:
+        st.error("Customer not found in simulated systems DB.")
+    elif assessment_key is not None:
+        assessments[assessment_key] = assessment
+        while len(assessments) > MAX_ASSESSMENTS:
+            assessments.pop(next(iter(assessments)))
+
+if assessment_key is not None and assessment_key in assessments:
+    show_assessment(assessments[assessment_key])
 
 
 ## Manual Review section
-def _load_manual_review_cases():
-    cases = []
-    for p in sorted(MANUAL_DIR.glob("manual_review_*.json"), reverse=True):
-        try:
-            data = json.loads(p.read_text(encoding="utf-8"))
-            customer = data.get("customer", {})
-            decision = data.get("decision", {})
-            ts = data.get("timestamp", "")
-
-            cases.append({
-                "file": p.name,
-                "path": str(p),
-                "timestamp": ts,
-                "customer_id": customer.get("id"),
-                "customer_name": customer.get("name"),
-                "overall_risk": decision.get("overall_risk"),
-                "interest_rate": decision.get("interest_rate"),
-                "recommendation": decision.get("recommendation"),
-                "data": data,  # keep full payload for viewing
-            })
-        except Exception:
-            # If file is corrupted, still list it
-            cases.append({
-                "file": p.name,
-                "path": str(p),
-                "timestamp": "",
-                "customer_id": None,
-                "customer_name": None,
-                "overall_risk": None,
-                "interest_rate": None,
-                "recommendation": "needs_manual_review",
-                "data": {"error": "Failed to parse JSON", "path": str(p)},
-            })
-    return cases
-
-st.markdown("## Manual Review Queue (Analyst Intervention Required)")
-MANUAL_DIR = Path(__file__).resolve().parent / "manual_review_cases"
-MANUAL_DIR.mkdir(exist_ok=True)
-cases = _load_manual_review_cases()
-
-if not cases:
-    st.info("No applicants currently in the manual review queue")
-else:
-    st.caption(f"{len(cases)} case(s) pending manual review")
-
-    # Optional filter
-    query = st.text_input("Filter by Customer ID or Name", "")
-    if query.strip():
-        q = query.strip().lower()
-        cases = [
-            c for c in cases
-            if (str(c.get("customer_id") or "").lower().find(q) >= 0)
-            or ((c.get("customer_name") or "").lower().find(q) >= 0)
-        ]
+@st.fragment
+def manual_review_panel():
+    st.markdown("## Manual Review Queue (Analyst Intervention Required)")
+
+    # Filtering and paging run in SQL; a case's full JSON is only loaded when it is opened
+    f1, f2, f3 = st.columns([2, 1, 2])
+    with f1:
+        query = st.text_input("Filter by Customer ID or Name", "")
+    with f2:
+        risk_filter = st.selectbox("Risk", ["any", "low", "medium", "high", "unknown"])
+    with f3:
+        date_range = st.date_input("Created between", value=(), help="Leave empty for all dates")
+
+    date_from = date_to = None
+    if len(date_range) == 2:
+        date_from = date_range[0].isoformat()
+        date_to = (date_range[1] + timedelta(days=1)).isoformat()
+    filters = dict(query=query, risk=None if risk_filter == "any" else risk_filter, date_from=date_from, date_to=date_to)
+
+    # Keyset pagination: a stack of page cursors, reset whenever the filters change
+    filter_key = json.dumps(filters)
+    if st.session_state.get("mr_filter_key") != filter_key:
+        st.session_state["mr_filter_key"] = filter_key
+        st.session_state["mr_cursors"] = [None]
+    cursors = st.session_state["mr_cursors"]
+
+    total = count_cases(**filters)
+    cases, next_cursor = list_cases(**filters, after=cursors[-1])
+
+    if not total:
+        st.info("No applicants currently in the manual review queue")
+        return
+
+    page_no = len(cursors)
+    st.caption(f"{total} case(s) pending manual review • page {page_no}")
 
     for c in cases:
-        title = f"{c.get('customer_name','Unknown')} (ID {c.get('customer_id','?')}) — {c.get('overall_risk','?')} risk"
+        title = f"{c.get('customer_name') or 'Unknown'} (ID {c.get('customer_id') or '?'}) — {c.get('overall_risk') or '?'} risk"
         with st.expander(title):
             a, b, d, e = st.columns(4)
             a.metric("Risk", c.get("overall_risk") or "—")
             b.metric("Rate", c.get("interest_rate") or "—")
             d.metric("Recommendation", c.get("recommendation") or "—")
-            e.metric("Timestamp", c.get("timestamp") or "—")
+            e.metric("Created", (c.get("created") or "—")[:19])
+
+            st.write(f"**Case:** #{c['case_id']}")
 
-            st.write(f"**Case file:** `{c['file']}`")
+            if not st.checkbox("Open case", key=f"mr_open_{c['case_id']}"):
+                continue
+            data = get_case(c["case_id"]) or {}
 
             # Show a short human summary if present
-            decision = c["data"].get("decision", {})
+            decision = data.get("decision", {})
             rationale = decision.get("rationale")
             if rationale:
                 st.markdown("### Rationale")
                 st.write(rationale)
 
             # Evidence preview
-            ev = c["data"].get("evidence", [])
+            ev = data.get("evidence", [])
             if ev:
                 st.markdown("### Evidence (preview)")
                 for item in ev[:3]:
-                    st.markdown(f"**{item.get('chunk_id','')}** (score={item.get('score',0):.3f})")
+                    st.markdown(f"**{item.get('chunk_id','')}** (score={item.get('score') or 0:.3f})")
                     st.write(item.get("text_preview", "")[:800])
                     st.markdown("---")
 
             # Full JSON for audit/debug
-            show_json = st.checkbox(f"Show full case JSON ({c['file']})", value=False)
-            if show_json:
-                st.json(c["data"])
-
+            if st.checkbox("Show full case JSON", key=f"mr_json_{c['case_id']}"):
+                st.json(data)
 
             # Download the case file
             st.download_button(
                 label="Download case JSON",
-                data=json.dumps(c["data"], indent=2).encode("utf-8"),
-                file_name=c["file"],
-                mime="application/json"
+                data=json.dumps(data, indent=2).encode("utf-8"),
+                file_name=case_file_name(c),
+                mime="application/json",
+                key=f"mr_dl_{c['case_id']}",
             )
+
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if page_no > 1 and st.button("← Newer cases"):
+            cursors.pop()
+            st.rerun(scope="fragment")
+    with next_col:
+        if next_cursor is not None and st.button("Older cases →"):
+            cursors.append(next_cursor)
+            st.rerun(scope="fragment")
+
+manual_review_panel()
@@ -1,30 +1,282 @@
+import atexit
+import gzip
 import json
-import re
+import os
+import queue
+import threading
+import time
+import uuid
 from pathlib import Path
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import span
 
 AUDIT_DIR = Path(__file__).resolve().parent / "audits"
 AUDIT_DIR.mkdir(exist_ok=True)
 
-def _safe_slug(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    return s.strip("_") or "unknown"
+# Durability: "batch" fsyncs after every written batch, "interval" at most
+# every AUDIT_FSYNC_INTERVAL seconds, "never" leaves it to the OS
+AUDIT_FSYNC = os.getenv("AUDIT_FSYNC", "interval").lower()
+AUDIT_FSYNC_INTERVAL = float(os.getenv("AUDIT_FSYNC_INTERVAL", "1.0"))
+AUDIT_SEGMENT_MB = float(os.getenv("AUDIT_SEGMENT_MB", "64"))
+AUDIT_SEGMENT_SECONDS = float(os.getenv("AUDIT_SEGMENT_SECONDS", "3600"))
+AUDIT_COMPRESS = os.getenv("AUDIT_COMPRESS", "0") not in ("0", "false", "no")
+AUDIT_FLUSH_TIMEOUT = float(os.getenv("AUDIT_FLUSH_TIMEOUT", "30"))
+
+SEGMENT_GLOB = "audit-*.jsonl*"
+_MAX_BATCH = 1000
+_STOP = object()
+
+
+class AuditWriteError(RuntimeError):
+    """Audit records could not be saved (the cause is chained)."""
 
-def write_audit(payload: Dict[str, Any]) -> str:
+
+class AuditLog:
     """
-    Writes an audit JSON file and returns the filesystem path.
-    Filename format:
-      audit_<applicantname>_<id>_<YYYYMMDD_HHMMSS>.json
+    Append-only audit log made of JSONL segments in `audit_dir`.
+    - write() stamps the record with a unique audit_id, serialises it and
+      queues it; a background thread appends queued records in batches
+    - Segments roll over by size and age, named
+      audit-<YYYYmmdd_HHMMSS>-<pid>-<seq>.jsonl (gzipped on rollover if
+      `compress`), so several processes can log to the same directory
+    - flush() blocks until everything written so far is on disk
+    - If appending fails (e.g. disk full), the writer keeps the unwritten
+      lines and retries them in a fresh segment; until a retry succeeds,
+      write() and flush() raise AuditWriteError instead of accepting records
+      that may never be saved. A record can appear twice after such a
+      failure (audit_id tells the copies apart from new records).
     """
-    customer = payload.get("customer", {}) or {}
-    name_slug = _safe_slug(customer.get("name"))
-    cid = customer.get("id", "unknown")
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    filename = f"audit_{name_slug}_{cid}_{ts}.json"
-    path = AUDIT_DIR / filename
+    def __init__(
+        self,
+        audit_dir: Path = AUDIT_DIR,
+        fsync: str = AUDIT_FSYNC,
+        fsync_interval: float = AUDIT_FSYNC_INTERVAL,
+        segment_bytes: int = int(AUDIT_SEGMENT_MB * 1024 * 1024),
+        segment_seconds: float = AUDIT_SEGMENT_SECONDS,
+        compress: bool = AUDIT_COMPRESS,
+    ):
+        self.audit_dir = Path(audit_dir)
+        self.audit_dir.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.compress = compress
+        self._q: "queue.Queue" = queue.Queue(maxsize=100000)
+        self._f = None
+        self._path: Optional[Path] = None
+        self._opened_at = 0.0
+        self._seq = 0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._unwritten: List[str] = []
+        self.error: Optional[BaseException] = None
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def _check(self):
+        if self.error is not None:
+            raise AuditWriteError(f"Audit log write failed: {self.error}") from self.error
+        if not self._thread.is_alive():
+            raise AuditWriteError("Audit log writer is not running")
+
+    def write(self, payload: Dict[str, Any]) -> str:
+        """Queue one audit record; returns its audit_id. Raises the writer's last error, if any."""
+        self._check()
+        audit_id = uuid.uuid4().hex
+        record = {"audit_id": audit_id, "timestamp": datetime.now().isoformat(timespec="milliseconds"), **payload}
+        # Serialised here so later changes to payload can't leak into the log
+        self._q.put(json.dumps(record, default=str) + "\n")
+        return audit_id
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far is on disk. Returns False on
+        timeout; raises if the writer failed to save it.
+        """
+        self._check()
+        done = threading.Event()
+        self._q.put(done)
+        if not done.wait(timeout):
+            return False
+        self._check()
+        return True
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join()
+
+    @property
+    def current_segment(self) -> Optional[Path]:
+        return self._path
+
+    def _open_segment(self):
+        self._seq += 1
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._path = self.audit_dir / f"audit-{ts}-{os.getpid()}-{self._seq:04d}.jsonl"
+        self._f = open(self._path, "a", encoding="utf-8")
+        self._opened_at = time.monotonic()
+
+    def _close_segment(self):
+        if self._f is None:
+            return
+        self._sync(force=True)
+        self._f.close()
+        if self.compress and self._path.stat().st_size:
+            gz = Path(str(self._path) + ".gz")
+            tmp = gz.with_name(gz.name + ".tmp")
+            with open(self._path, "rb") as src, gzip.open(tmp, "wb") as dst:
+                while True:
+                    block = src.read(1 << 20)
+                    if not block:
+                        break
+                    dst.write(block)
+            os.replace(tmp, gz)
+            self._path.unlink()
+        self._f, self._path = None, None
+
+    def _sync(self, force: bool = False):
+        if self._f is None or not self._dirty:
+            return
+        self._f.flush()
+        now = time.monotonic()
+        if self.fsync == "batch" or force or (self.fsync == "interval" and now - self._last_sync >= self.fsync_interval):
+            if self.fsync != "never":
+                os.fsync(self._f.fileno())
+            self._last_sync = now
+            self._dirty = False
+
+    def _write_lines(self, lines):
+        if self._f is not None and (
+            self._f.tell() >= self.segment_bytes or time.monotonic() - self._opened_at >= self.segment_seconds
+        ):
+            self._close_segment()
+        if self._f is None:
+            self._open_segment()
+        self._f.write("".join(lines))
+        self._dirty = True
+
+    def _run(self):
+        while True:
+            try:
+                item = self._q.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                # Idle: retry after a failure, else make sure the last batch reaches the disk
+                if self._unwritten or self.error is not None:
+                    self._save([], force=True, stop=False)
+                else:
+                    try:
+                        self._sync()
+                    except Exception as e:
+                        self._failed(e)
+                continue
+            batch = [item]
+            while len(batch) < _MAX_BATCH:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
 
-    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
-    return str(path)
+            lines, waiters, stop = [], [], False
+            for it in batch:
+                if it is _STOP:
+                    stop = True
+                elif isinstance(it, threading.Event):
+                    waiters.append(it)
+                else:
+                    lines.append(it)
+            self._save(lines, force=bool(waiters), stop=stop)
+            for w in waiters:
+                w.set()
+            if stop:
+                return
+
+    def _save(self, lines, force: bool, stop: bool):
+        self._unwritten.extend(lines)
+        try:
+            with span("audit_flush"):
+                if self._unwritten:
+                    self._write_lines(self._unwritten)
+                elif self.error is not None and self._f is None:
+                    # Only a sync failed: a synced fresh segment shows the disk works again
+                    self._open_segment()
+                    self._dirty = True
+                self._sync(force=force)
+                if stop:
+                    self._close_segment()
+        except Exception as e:
+            self._failed(e)
+            return
+        self.written += len(self._unwritten)
+        self._unwritten = []
+        self.error = None
+
+    def _failed(self, e: BaseException):
+        # Kept for write()/flush() to raise; the unwritten lines are retried in a new segment
+        self.error = e
+        if self._f is not None:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f, self._path, self._dirty = None, None, False
+
+
+def iter_audit_records(audit_dir: Path = AUDIT_DIR) -> Iterator[Dict[str, Any]]:
+    """
+    Every record in the audit log, segment by segment in creation order
+    (plain or gzipped). A torn last line in a segment that is still being
+    written is skipped.
+    """
+    paths = sorted(p for p in Path(audit_dir).glob(SEGMENT_GLOB) if not p.name.endswith(".tmp"))
+    names = {p.name for p in paths}
+    for path in paths:
+        if path.name + ".gz" in names:
+            continue  # mid-compression: read the .gz copy instead
+        opener = gzip.open if path.suffix == ".gz" else open
+        try:
+            with opener(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue  # compressed away between glob and open
+
+
+_LOG: Optional[AuditLog] = None
+_LOG_LOCK = threading.Lock()
+
+def get_audit_log() -> AuditLog:
+    """Process-wide AuditLog (flushed and closed at interpreter exit)."""
+    global _LOG
+    if _LOG is None:
+        with _LOG_LOCK:
+            if _LOG is None:
+                _LOG = AuditLog()
+                atexit.register(_LOG.close)
+    return _LOG
+
+def flush_audit(timeout: float = AUDIT_FLUSH_TIMEOUT):
+    """Wait until every queued audit record is on disk; raises if it isn't within `timeout`."""
+    if not get_audit_log().flush(timeout):
+        raise AuditWriteError(f"Audit log not flushed within {timeout:.0f}s")
+
+
+def write_audit(payload: Dict[str, Any], sync: bool = False) -> str:
+    """
+    Appends an audit record to the segmented audit log and returns its
+    audit_id. With sync=True, waits until the record is on disk (and
+    raises if it can't be saved).
+    """
+    with span("audit_write"):
+        audit_id = get_audit_log().write(payload)
+        if sync:
+            flush_audit()
+    return audit_id
@@ -0,0 +1,353 @@
+"""
+Headless batch assessment: customer IDs in, one JSON result per line out.
+
+Each input line is a JSON object with "customer_id" (or "id"), or a bare
+integer. Customers flow through a pipeline of concurrent stages:
+
+  lookup (set-based DB query) -> retrieve (batched policy search) ->
+  decide (rule table / Gemini via the rate-limited executor) ->
+  write (audit, manual review case, decision note + applicant letter,
+  result line)
+
+Results are appended to the output JSONL as they complete, so a crashed
+or interrupted run continues where it stopped: customers already written
+with status "ok" or "not_found" are skipped ("error" lines are retried).
+Throughput and per-stage timings are printed at the end and saved to
+<output>.summary.json, together with the process metrics (per-stage
+p50/p95/p99 spans, cache hit rates, LLM tokens; see metrics.py).
+
+Usage:
+  python batch_assess.py customers.jsonl
+  python batch_assess.py customers.jsonl -o results.jsonl --concurrency 32
+  python batch_assess.py customers.jsonl --policies "Bank Loan Overall Risk Policy.pdf" --no-letters
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set
+
+import numpy as np
+
+from applicant_letter_generator import build_applicant_letter
+from audit_logger import flush_audit, write_audit
+from data_connectors import get_customer_profiles
+from decision_engine import assess_async, build_rag_query
+from decision_note import build_decision_note
+from manual_review_writer import write_manual_review_case
+from metrics import METRICS_PORT, get_metrics, start_metrics_server
+from policy_rag import index_build_id, policy_rules, retrieve_many
+
+STAGES = ("lookup", "retrieve", "decide", "write")
+_DONE = object()  # end-of-stream marker passed between stages
+COMMIT_EVERY = 200  # result lines buffered before the audit log is flushed and they are written
+
+
+def iter_customer_ids(path: Path) -> Iterator[int]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                cid = rec.get("customer_id", rec.get("id")) if isinstance(rec, dict) else rec
+                yield int(cid)
+            except (TypeError, ValueError):
+                print(f"Skipping unreadable input line: {line[:80]}")
+
+
+def completed_ids(path: Path) -> Set[int]:
+    """Customer IDs already finished in a previous run of the same output file."""
+    done: Set[int] = set()
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            if rec.get("status") in ("ok", "not_found"):
+                done.add(int(rec["customer_id"]))
+    return done
+
+
+class BatchRunner:
+    def __init__(self, args):
+        self.args = args
+        self.out_path = Path(args.output)
+        self.out_dir = Path(args.out_dir)
+        self.sources = args.policies or None
+        self.rules = policy_rules(self.sources)
+        self.index_id = index_build_id()
+        self.timings: Dict[str, List[float]] = {s: [] for s in STAGES}
+        self.counts = {"ok": 0, "not_found": 0, "error": 0, "skipped": 0, "llm": 0, "rules": 0, "cached": 0, "prompt_tokens": 0}
+
+    async def _timed(self, item: Dict[str, Any], stage: str, fn, *a):
+        t0 = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*a)
+            return await asyncio.to_thread(fn, *a)
+        finally:
+            dt = time.perf_counter() - t0
+            item["timings"][stage] = round(dt, 4)
+            self.timings[stage].append(dt)
+
+    async def _read(self, out_q: asyncio.Queue):
+        done = completed_ids(self.out_path)
+        seen: Set[int] = set()
+        for cid in iter_customer_ids(Path(self.args.input)):
+            if cid in done or cid in seen:
+                self.counts["skipped"] += cid in done
+                continue
+            seen.add(cid)
+            await out_q.put({"customer_id": cid, "timings": {}, "t0": time.perf_counter()})
+        await out_q.put(_DONE)
+
+    async def _lookup(self, in_q: asyncio.Queue, out_q: asyncio.Queue, write_q: asyncio.Queue):
+        finished = False
+        while not finished:
+            batch = await self._take_batch(in_q, self.args.lookup_batch)
+            if batch and batch[-1] is _DONE:
+                await in_q.put(_DONE)  # let sibling workers see it too
+                finished = True
+                batch = batch[:-1]
+            if not batch:
+                continue
+            ids = [it["customer_id"] for it in batch]
+            t0 = time.perf_counter()
+            try:
+                found = await asyncio.to_thread(lambda: {p["id"]: p for p in get_customer_profiles(ids)})
+            except Exception as e:
+                for it in batch:
+                    it["status"], it["error"] = "error", f"lookup: {type(e).__name__}: {e}"
+                    await write_q.put(it)
+                continue
+            dt = time.perf_counter() - t0
+            for it in batch:
+                it["timings"]["lookup"] = round(dt / len(batch), 4)
+                self.timings["lookup"].append(dt / len(batch))
+                it["customer"] = found.get(it["customer_id"])
+                if it["customer"] is None:
+                    it["status"] = "not_found"
+                    await write_q.put(it)
+                else:
+                    await out_q.put(it)
+
+    @staticmethod
+    async def _take_batch(in_q: asyncio.Queue, size: int) -> List[Any]:
+        """Wait for one item, then take whatever else is already queued (up to size). _DONE ends a batch."""
+        batch = [await in_q.get()]
+        while batch[-1] is not _DONE and len(batch) < size and not in_q.empty():
+            batch.append(in_q.get_nowait())
+        return batch
+
+    async def _retrieve(self, in_q: asyncio.Queue, out_q: asyncio.Queue, write_q: asyncio.Queue):
+        finished = False
+        while not finished:
+            batch = await self._take_batch(in_q, self.args.retrieve_batch)
+            if batch[-1] is _DONE:
+                finished = True
+                batch = batch[:-1]
+            if not batch:
+                continue
+            queries = [build_rag_query(it["customer"]) for it in batch]
+            t0 = time.perf_counter()
+            try:
+                results = await asyncio.to_thread(retrieve_many, queries, self.args.k, self.sources)
+            except Exception as e:
+                for it in batch:
+                    it["status"], it["error"] = "error", f"retrieve: {type(e).__name__}: {e}"
+                    await write_q.put(it)
+                continue
+            dt = time.perf_counter() - t0
+            for it, q, ev in zip(batch, queries, results):
+                # Batch wall time is shared by its members
+                it["timings"]["retrieve"] = round(dt / len(batch), 4)
+                self.timings["retrieve"].append(dt / len(batch))
+                it["rag_query"], it["evidence"] = q, ev
+                await out_q.put(it)
+
+    async def _decide(self, in_q: asyncio.Queue, write_q: asyncio.Queue):
+        while True:
+            item = await in_q.get()
+            if item is _DONE:
+                await in_q.put(_DONE)
+                return
+            try:
+                item["result"] = await self._timed(
+                    item, "decide", assess_async, item["customer"], item["evidence"], self.rules,
+                    False, self.index_id, self.args.timeout,
+                )
+                item["status"] = "ok"
+            except Exception as e:
+                item["status"], item["error"] = "error", f"decide: {type(e).__name__}: {e}"
+            await write_q.put(item)
+
+    def _write_outputs(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        customer, result, evidence = item["customer"], item["result"], item["evidence"]
+        paths = {"audit_id": write_audit({
+            "customer": customer,
+            "rag_query": item["rag_query"],
+            "evidence": evidence,
+            "result": result,
+        })}
+        if result.get("recommendation") == "needs_manual_review":
+            paths["manual_review"] = write_manual_review_case(customer, result, evidence, item["rag_query"])
+        if not self.args.no_letters:
+            cid = customer["id"]
+            note = self.out_dir / "notes" / f"decision_note_{cid}.txt"
+            letter = self.out_dir / "letters" / f"applicant_letter_{cid}.txt"
+            note.write_text(build_decision_note(customer, result, evidence), encoding="utf-8")
+            letter.write_text(build_applicant_letter(customer, result), encoding="utf-8")
+            paths["decision_note"], paths["applicant_letter"] = str(note), str(letter)
+        return paths
+
+    async def _write(self, in_q: asyncio.Queue, out_f, total_upstream: int):
+        remaining = total_upstream
+        n = 0
+        t_start = time.perf_counter()
+        pending: List[str] = []
+
+        async def commit():
+            # Result lines mark customers as done for a resumed run, so they
+            # only go out once the audit records they point to are on disk;
+            # if the audit log can't be saved the run stops here
+            await asyncio.to_thread(flush_audit)
+            out_f.write("".join(pending))
+            out_f.flush()
+            pending.clear()
+
+        while remaining:
+            item = await in_q.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if item.get("status") == "ok":
+                try:
+                    item["outputs"] = await self._timed(item, "write", self._write_outputs, item)
+                except Exception as e:
+                    item["status"], item["error"] = "error", f"write: {type(e).__name__}: {e}"
+
+            result = item.get("result") or {}
+            rec = {
+                "customer_id": item["customer_id"],
+                "status": item["status"],
+                "overall_risk": result.get("overall_risk"),
+                "interest_rate": result.get("interest_rate"),
+                "recommendation": result.get("recommendation"),
+                "decided_by": result.get("decided_by"),
+                "cached": bool(result.get("cached")),
+                "evidence": [e["chunk_id"] for e in item.get("evidence", [])],
+                "outputs": item.get("outputs"),
+                "error": item.get("error"),
+                "timings": {**item["timings"], "total": round(time.perf_counter() - item["t0"], 4)},
+            }
+            pending.append(json.dumps(rec) + "\n")
+            if len(pending) >= COMMIT_EVERY or in_q.empty():
+                await commit()
+
+            self.counts[item["status"]] += 1
+            if item["status"] == "ok":
+                self.counts["rules" if str(rec["decided_by"]).startswith("policy_rules") else "llm"] += 1
+                self.counts["cached"] += rec["cached"]
+                if not rec["cached"]:
+                    self.counts["prompt_tokens"] += (result.get("usage") or {}).get("prompt_tokens", 0)
+            n += 1
+            if n % self.args.progress_every == 0:
+                rate = n / (time.perf_counter() - t_start)
+                print(f"{n} done ({rate:.1f}/s)", flush=True)
+        if pending:
+            await commit()
+
+    async def run(self) -> Dict[str, Any]:
+        a = self.args
+        if not a.no_letters:
+            (self.out_dir / "notes").mkdir(parents=True, exist_ok=True)
+            (self.out_dir / "letters").mkdir(parents=True, exist_ok=True)
+        # Bounded queues give backpressure between stages
+        lookup_q = asyncio.Queue(maxsize=a.queue_size)
+        retrieve_q = asyncio.Queue(maxsize=a.queue_size)
+        decide_q = asyncio.Queue(maxsize=a.queue_size)
+        write_q = asyncio.Queue(maxsize=a.queue_size)
+
+        async def lookups():
+            await asyncio.gather(*(self._lookup(lookup_q, retrieve_q, write_q) for _ in range(a.lookup_workers)))
+            await retrieve_q.put(_DONE)
+            await write_q.put(_DONE)
+
+        async def retrieval():
+            await self._retrieve(retrieve_q, decide_q, write_q)
+            await decide_q.put(_DONE)
+            await write_q.put(_DONE)
+
+        async def decisions():
+            await asyncio.gather(*(self._decide(decide_q, write_q) for _ in range(a.concurrency)))
+            await write_q.put(_DONE)
+
+        t0 = time.perf_counter()
+        with open(self.out_path, "a", encoding="utf-8") as out_f:
+            await asyncio.gather(
+                self._read(lookup_q), lookups(), retrieval(), decisions(),
+                self._write(write_q, out_f, total_upstream=3),
+            )
+        return self.summary(time.perf_counter() - t0)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        processed = self.counts["ok"] + self.counts["not_found"] + self.counts["error"]
+        stages = {}
+        for stage, ts in self.timings.items():
+            if ts:
+                arr = np.array(ts) * 1000
+                stages[stage] = {
+                    "n": len(ts),
+                    "mean_ms": round(float(arr.mean()), 2),
+                    "p50_ms": round(float(np.percentile(arr, 50)), 2),
+                    "p95_ms": round(float(np.percentile(arr, 95)), 2),
+                    "max_ms": round(float(arr.max()), 2),
+                }
+        return {
+            "input": str(self.args.input),
+            "output": str(self.out_path),
+            "processed": processed,
+            **self.counts,
+            "elapsed_s": round(elapsed, 2),
+            "per_minute": round(60 * processed / elapsed, 1) if elapsed else 0.0,
+            "stages": stages,
+            "metrics": get_metrics().summary(),
+        }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", help="JSONL file of customer IDs")
+    ap.add_argument("-o", "--output", help="results JSONL (default: <input>.results.jsonl)")
+    ap.add_argument("--out-dir", default="batch_output", help="where decision notes and letters are written")
+    ap.add_argument("--policies", nargs="*", help="policy files to retrieve from (default: all)")
+    ap.add_argument("-k", type=int, default=5, help="evidence chunks per customer")
+    ap.add_argument("--concurrency", type=int, default=16, help="decisions in flight (Gemini limits still apply)")
+    ap.add_argument("--lookup-workers", type=int, default=2, help="concurrent DB lookup batches")
+    ap.add_argument("--lookup-batch", type=int, default=500, help="max customers per DB lookup query")
+    ap.add_argument("--retrieve-batch", type=int, default=32, help="max queries per retrieval batch")
+    ap.add_argument("--queue-size", type=int, default=256, help="max items waiting between two stages")
+    ap.add_argument("--timeout", type=float, default=None, help="per-decision deadline in seconds")
+    ap.add_argument("--no-letters", action="store_true", help="skip decision notes and applicant letters")
+    ap.add_argument("--progress-every", type=int, default=100, help="print progress every N customers")
+    ap.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="serve Prometheus /metrics during the run (0 = off)")
+    args = ap.parse_args()
+    if not args.output:
+        args.output = str(Path(args.input).with_suffix("")) + ".results.jsonl"
+    port = start_metrics_server(args.metrics_port)
+    if port:
+        print(f"Metrics at http://127.0.0.1:{port}/metrics")
+
+    summary = asyncio.run(BatchRunner(args).run())
+    Path(args.output + ".summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Parity check and benchmark for the embedding backends in embedding_backends.
+
+For each backend (torch, onnx, onnx-int8) reports:
+- cold start: import + model load + first encode, in a fresh interpreter
+- per-query latency p50 / p99 (single short query, as retrieve() does)
+- batch throughput in texts/sec (batch_size=64)
+- parity vs torch: min / mean cosine similarity of the embeddings and
+  top-k overlap of a search over the sample texts
+
+Usage:
+  python bench_embedding_backends.py --export     # export ONNX + int8 model first
+  python bench_embedding_backends.py
+  python bench_embedding_backends.py --threads 4 --min-cosine 0.99
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from embedding_backends import EMBED_BACKENDS, ONNX_DIR, export_onnx, load_embedder
+from chunk_store import ChunkMetaStore
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+META_BASE = "vector_store/policy_meta"
+
+SAMPLE_QUERIES = [
+    "Determine overall risk and interest rate for credit_score=455, account_status=good-standing",
+    "credit score band 700-749 risk level",
+    "delinquent account interest rate",
+    "Non-Singaporean without PR status",
+    "be conservative if between categories",
+]
+
+
+def sample_texts(n: int) -> List[str]:
+    store = ChunkMetaStore.open(Path(META_BASE))
+    texts = [m["text"] for m in store] if store is not None else []
+    # Pad with synthetic policy-like rows so throughput numbers are stable
+    i = 0
+    while len(texts) < n:
+        texts.append(f"Credit score {300 + (i * 7) % 550}-{349 + (i * 7) % 550}: risk "
+                     f"{['low', 'medium', 'high'][i % 3]}, rate {3 + (i % 9) * 0.5:.1f}% p.a. row {i}")
+        i += 1
+    return texts[:n]
+
+
+def cold_start_s(backend: str, threads: int) -> float:
+    code = (
+        "import time; t = time.perf_counter()\n"
+        "from embedding_backends import load_embedder\n"
+        f"m = load_embedder({MODEL_NAME!r}, {backend!r}, threads={threads})\n"
+        "m.encode(['warm up'], normalize_embeddings=True)\n"
+        "print(time.perf_counter() - t)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def bench_backend(backend: str, texts: List[str], threads: int, query_runs: int) -> Dict:
+    model = load_embedder(MODEL_NAME, backend, threads=threads)
+    model.encode(["warm up"], normalize_embeddings=True)
+
+    lat = []
+    for i in range(query_runs):
+        q = SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]
+        t0 = time.perf_counter()
+        model.encode([q], normalize_embeddings=True)
+        lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    embs = np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=64), dtype="float32")
+    batch_s = time.perf_counter() - t0
+    q_embs = np.asarray(model.encode(SAMPLE_QUERIES, normalize_embeddings=True), dtype="float32")
+
+    return {
+        "backend": backend,
+        "cold_start_s": cold_start_s(backend, threads),
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "texts_per_s": len(texts) / batch_s,
+        "embs": embs,
+        "q_embs": q_embs,
+    }
+
+
+def parity(ref: Dict, other: Dict, k: int) -> Dict:
+    cos = np.sum(ref["embs"] * other["embs"], axis=1)
+    ref_top = np.argsort(-(ref["q_embs"] @ ref["embs"].T), axis=1)[:, :k]
+    oth_top = np.argsort(-(other["q_embs"] @ other["embs"].T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, oth_top)])
+    return {"min_cos": float(cos.min()), "mean_cos": float(cos.mean()), f"top{k}_overlap": float(overlap)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--export", action="store_true", help=f"export the ONNX models to {ONNX_DIR} first")
+    ap.add_argument("--backends", default=",".join(EMBED_BACKENDS))
+    ap.add_argument("--texts", type=int, default=1000, help="texts for the throughput/parity run")
+    ap.add_argument("--queries", type=int, default=200, help="single-query encodes for latency")
+    ap.add_argument("--threads", type=int, default=0, help="compute threads (0 = library default)")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--min-cosine", type=float, default=0.98, help="fail if any backend falls below this vs torch")
+    args = ap.parse_args()
+
+    if args.export:
+        print(f"Exporting {MODEL_NAME} to {export_onnx(MODEL_NAME, ONNX_DIR)}")
+
+    texts = sample_texts(args.texts)
+    results = [bench_backend(b, texts, args.threads, args.queries) for b in args.backends.split(",")]
+    ref = next((r for r in results if r["backend"] == "torch"), None)
+
+    print(f"{'backend':<11}{'cold s':>8}{'p50 ms':>9}{'p99 ms':>9}{'texts/s':>10}{'min cos':>9}{'mean cos':>10}{f'top{args.k}':>7}")
+    failed = False
+    for r in results:
+        line = f"{r['backend']:<11}{r['cold_start_s']:>8.2f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['texts_per_s']:>10.0f}"
+        if ref is not None and r is not ref:
+            p = parity(ref, r, args.k)
+            failed |= p["min_cos"] < args.min_cosine
+            line += f"{p['min_cos']:>9.4f}{p['mean_cos']:>10.4f}{p[f'top{args.k}_overlap']:>7.2f}"
+        print(line)
+
+    if failed:
+        print(f"Parity check FAILED: min cosine below {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Recall / latency / memory benchmark for the policy index types.
+
+Compares each index type in policy_index against the exact flat baseline:
+- recall@k vs brute-force inner product
+- p50 / p99 single-query latency
+- serialized index size (a good proxy for resident memory)
+- build (train + add) time
+
+Usage:
+  python bench_policy_index.py                  # use cached policy embeddings
+  python bench_policy_index.py --n 200000       # synthetic corpus of 200k chunks
+  python bench_policy_index.py --n 200000 --nprobe 8,16,64 --ef-search 32,64,128
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, Any, List
+
+import numpy as np
+import faiss
+
+from policy_index import INDEX_TYPES, make_index, index_kind, search_params
+
+EMB_CACHE_DIR = Path("vector_store") / "cache" / "emb"
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype="float32")
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def synthetic_corpus(n: int, dim: int, n_queries: int, seed: int):
+    # Clustered data looks more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    n_centers = max(8, int(np.sqrt(n)))
+    centers = rng.standard_normal((n_centers, dim)).astype("float32")
+    assign = rng.integers(0, n_centers, n)
+    data = centers[assign] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    q_assign = rng.integers(0, n_centers, n_queries)
+    queries = centers[q_assign] + 0.35 * rng.standard_normal((n_queries, dim)).astype("float32")
+    return _normalize(data), _normalize(queries)
+
+
+def cached_corpus(n_queries: int, seed: int):
+    files = sorted(EMB_CACHE_DIR.rglob("*.npz"))
+    if not files:
+        raise SystemExit("No cached embeddings in vector_store/cache/emb; build the index first or pass --n.")
+    data = _normalize(np.concatenate([np.load(str(p))["embs"] for p in files]))
+    # Queries: perturbed copies of random chunks
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(data), n_queries)
+    queries = data[picks] + 0.1 * rng.standard_normal((n_queries, data.shape[1])).astype("float32")
+    return data, _normalize(queries)
+
+
+def _latencies_ms(index: faiss.Index, queries: np.ndarray, k: int, params) -> np.ndarray:
+    out = np.empty(len(queries))
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        index.search(queries[i:i + 1], k, params=params)
+        out[i] = (time.perf_counter() - t0) * 1000
+    return out
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (k * len(truth))
+
+
+def run(data: np.ndarray, queries: np.ndarray, k: int, types: List[str],
+        nprobes: List[int], ef_searches: List[int]) -> List[Dict[str, Any]]:
+    dim = data.shape[1]
+    ids = np.arange(len(data), dtype="int64")
+
+    exact = faiss.IndexFlatIP(dim)
+    exact.add(data)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in types:
+        t0 = time.perf_counter()
+        index = make_index(index_type, dim, data)
+        index.add_with_ids(data, ids)
+        build_s = time.perf_counter() - t0
+        kind = index_kind(index)
+        mem_mb = len(faiss.serialize_index(index)) / 1e6
+
+        if kind == "hnsw":
+            settings = [{"ef_search": ef} for ef in ef_searches]
+        elif kind in ("ivf_flat", "ivf_pq"):
+            settings = [{"nprobe": p} for p in nprobes]
+        else:
+            settings = [{}]
+
+        for tuning in settings:
+            params = search_params(index, **tuning)
+            _, found = index.search(queries, k, params=params)
+            lat = _latencies_ms(index, queries, k, params)
+            rows.append({
+                "index_type": index_type,
+                "built_as": kind,
+                "tuning": tuning,
+                f"recall@{k}": round(_recall(found, truth), 4),
+                "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                "p99_ms": round(float(np.percentile(lat, 99)), 3),
+                "memory_mb": round(mem_mb, 2),
+                "build_s": round(build_s, 2),
+            })
+    return rows
+
+
+def _int_list(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=0, help="synthetic corpus size (0 = cached policy embeddings)")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--types", default=",".join(INDEX_TYPES))
+    ap.add_argument("--nprobe", default="4,16,64")
+    ap.add_argument("--ef-search", default="32,64,128")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args()
+
+    if args.n:
+        data, queries = synthetic_corpus(args.n, args.dim, args.queries, args.seed)
+    else:
+        data, queries = cached_corpus(args.queries, args.seed)
+    print(f"Corpus: {len(data)} vectors x {data.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    rows = run(data, queries, args.k, args.types.split(","), _int_list(args.nprobe), _int_list(args.ef_search))
+
+    header = f"{'type':<10}{'built as':<10}{'tuning':<18}{'recall':>8}{'p50 ms':>9}{'p99 ms':>9}{'mem MB':>9}{'build s':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        tuning = ",".join(f"{k}={v}" for k, v in r["tuning"].items()) or "-"
+        print(f"{r['index_type']:<10}{r['built_as']:<10}{tuning:<18}{r[f'recall@{args.k}']:>8.3f}"
+              f"{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['memory_mb']:>9.2f}{r['build_s']:>9.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words, and numbers with their decimals/percent sign kept ("3.5%", "700")
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?%?")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    # "3.5%" also matches a query that just says 3.5
+    return tokens + [t[:-1] for t in tokens if t.endswith("%")]
+
+
+class BM25Index:
+    """
+    In-process BM25 over policy chunks, keyed by the same vector IDs as
+    the FAISS index.
+    - Stored as a forward index (per-chunk term ids + counts), so removing
+      or adding a file's chunks is a cheap row filter/append
+    - The inverted postings are derived with one argsort when opened
+    """
+
+    def __init__(self, vocab: Dict[str, int], doc_ids: np.ndarray, doc_len: np.ndarray,
+                 indptr: np.ndarray, term_ids: np.ndarray, tfs: np.ndarray):
+        self._vocab = vocab
+        self._doc_ids = doc_ids
+        self._doc_len = doc_len
+        self._indptr = indptr
+        self._term_ids = term_ids
+        self._tfs = tfs
+        self._build_postings()
+
+    def _build_postings(self):
+        n_terms = len(self._vocab)
+        rows = np.repeat(np.arange(len(self._doc_ids)), np.diff(self._indptr))
+        order = np.argsort(self._term_ids, kind="stable")
+        self._post_rows = rows[order]
+        self._post_tfs = self._tfs[order].astype("float32")
+        counts = np.bincount(self._term_ids, minlength=n_terms) if n_terms else np.zeros(0, dtype="int64")
+        self._term_ptr = np.concatenate([[0], np.cumsum(counts)])
+        self._avgdl = float(self._doc_len.mean()) if len(self._doc_len) else 0.0
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls({}, np.empty(0, "int64"), np.empty(0, "int32"), np.zeros(1, "int64"),
+                   np.empty(0, "int32"), np.empty(0, "int32"))
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Tuple[int, str]]) -> "BM25Index":
+        return cls.empty().updated([], list(docs))
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["BM25Index"]:
+        if not path.exists():
+            return None
+        d = np.load(str(path))
+        vocab = {str(t): i for i, t in enumerate(d["vocab"])}
+        return cls(vocab, d["doc_ids"], d["doc_len"], d["indptr"], d["term_ids"], d["tfs"])
+
+    def save(self, path: Path):
+        terms = sorted(self._vocab, key=self._vocab.get)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, vocab=np.array(terms, dtype=str), doc_ids=self._doc_ids, doc_len=self._doc_len,
+                     indptr=self._indptr, term_ids=self._term_ids, tfs=self._tfs)
+        os.replace(tmp, path)
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def updated(self, remove_ids: Iterable[int], new_docs: List[Tuple[int, str]]) -> "BM25Index":
+        """New index with `remove_ids` dropped and (id, text) docs appended."""
+        keep = ~np.isin(self._doc_ids, np.fromiter(remove_ids, dtype="int64"))
+        lens = np.diff(self._indptr)
+        entry_keep = np.repeat(keep, lens)
+
+        vocab = dict(self._vocab)
+        doc_ids = [self._doc_ids[keep]]
+        doc_len = [self._doc_len[keep]]
+        row_nnz = [lens[keep]]
+        term_ids = [self._term_ids[entry_keep]]
+        tfs = [self._tfs[entry_keep]]
+
+        for vid, text in new_docs:
+            counts: Dict[int, int] = {}
+            toks = tokenize(text)
+            for t in toks:
+                tid = vocab.setdefault(t, len(vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            doc_ids.append(np.array([vid], dtype="int64"))
+            doc_len.append(np.array([len(toks)], dtype="int32"))
+            row_nnz.append(np.array([len(counts)], dtype="int64"))
+            term_ids.append(np.fromiter(counts.keys(), dtype="int32", count=len(counts)))
+            tfs.append(np.fromiter(counts.values(), dtype="int32", count=len(counts)))
+
+        nnz = np.concatenate(row_nnz).astype("int64")
+        return BM25Index(
+            vocab,
+            np.concatenate(doc_ids).astype("int64"),
+            np.concatenate(doc_len).astype("int32"),
+            np.concatenate([[0], np.cumsum(nnz)]).astype("int64"),
+            np.concatenate(term_ids).astype("int32"),
+            np.concatenate(tfs).astype("int32"),
+        )
+
+    def search(self, query: str, k: int, allowed_ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (vector id, BM25 score) for the query, optionally restricted to allowed_ids."""
+        n = len(self._doc_ids)
+        if not n or k <= 0:
+            return []
+        tids = sorted({self._vocab[t] for t in tokenize(query) if t in self._vocab})
+        if not tids:
+            return []
+
+        scores = np.zeros(n, dtype="float32")
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len.astype("float32") / max(self._avgdl, 1e-9))
+        for tid in tids:
+            a, b = self._term_ptr[tid], self._term_ptr[tid + 1]
+            if a == b:
+                continue
+            rows, tf = self._post_rows[a:b], self._post_tfs[a:b]
+            df = b - a
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (BM25_K1 + 1) / (tf + norm[rows])
+
+        if allowed_ids is not None:
+            scores[~np.isin(self._doc_ids, allowed_ids)] = 0
+        hit = np.flatnonzero(scores > 0)
+        if not len(hit):
+            return []
+        top = hit[np.argsort(-scores[hit], kind="stable")[:k]]
+        return [(int(self._doc_ids[r]), float(scores[r])) for r in top]
@@ -1,6 +1,17 @@
+"""
+Create the simulated bank systems DB.
+
+Usage:
+  python bootstrap_db.py                                  # the 5 sample customers
+  python bootstrap_db.py --customers 2000000 --seed 7     # samples + 2M synthetic customers
+"""
+import argparse
 import sqlite3
+import time
 from pathlib import Path
 
+import numpy as np
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "bank_systems.db"
 
@@ -25,13 +36,32 @@ PR_ROWS = [
     (4444, "Andy", "andy@gmail.com", 0),
 ]
 
-def main():
-    print("Writing DB to:", DB_PATH)
+# Synthetic customers: IDs start above the samples
+SYNTH_FIRST_ID = 100000
+SYNTH_BATCH = 200000  # rows generated and inserted per transaction
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+# Rough shape of a retail loan book
+SCORE_MEAN, SCORE_SD = 690, 75  # clipped to the 300-850 policy range
+STATUS_P = {"good-standing": 0.80, "closed": 0.12, "delinquent": 0.08}
+SINGAPOREAN_P = 0.70
+PR_P = 0.45  # share of non-Singaporeans with PR
 
-    # Create tables
+FIRST_NAMES = ["Alex", "Bella", "Chen", "Daniel", "Emily", "Farah", "Gopal", "Hana", "Ivan", "Jia",
+               "Kumar", "Lina", "Marcus", "Nur", "Oliver", "Priya", "Qi", "Rachel", "Siti", "Tan",
+               "Umar", "Vera", "Wei", "Xin", "Yusuf", "Zara"]
+LAST_NAMES = ["Lim", "Tan", "Ng", "Wong", "Lee", "Goh", "Chua", "Ong", "Koh", "Teo",
+              "Rahman", "Ismail", "Singh", "Kaur", "Pillai", "Nair", "Smith", "Garcia", "Kim", "Chen"]
+DOMAINS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com"]
+
+# Lookups by id use the INTEGER PRIMARY KEY; these serve segment queries (re-scoring by band/status)
+SECONDARY_INDEXES = {
+    "idx_credit_scores_score": "credit_scores(credit_score)",
+    "idx_account_status_status": "account_status(account_status)",
+    "idx_account_status_nationality": "account_status(nationality)",
+}
+
+
+def create_tables(cur):
     cur.execute("""
     CREATE TABLE IF NOT EXISTS credit_scores (
       id INTEGER PRIMARY KEY,
@@ -57,7 +87,91 @@ def main():
       pr_status INTEGER
     )""")
 
+
+def synthetic_batches(n: int, seed: int, batch: int = SYNTH_BATCH):
+    """
+    Yield (credit_rows, account_rows, pr_rows) for n customers, `batch` at
+    a time. Every column draws from its own seeded stream, so a given seed
+    always produces the same customer for the same ID, whatever n is.
+    """
+    score_rng, status_rng, nat_rng, pr_rng, first_rng, last_rng, dom_rng = (
+        np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(7)
+    )
+    statuses = np.array(list(STATUS_P))
+    status_p = np.array(list(STATUS_P.values()))
+    first, last, domains = np.array(FIRST_NAMES), np.array(LAST_NAMES), np.array(DOMAINS)
+
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        ids = np.arange(SYNTH_FIRST_ID + start, SYNTH_FIRST_ID + start + size)
+        scores = np.clip(np.rint(score_rng.normal(SCORE_MEAN, SCORE_SD, size)), 300, 850).astype(int)
+        status = statuses[status_rng.choice(len(statuses), size, p=status_p)]
+        local = nat_rng.random(size) < SINGAPOREAN_P
+        has_pr = pr_rng.random(size) < PR_P
+        fn = first[first_rng.integers(0, len(first), size)]
+        ln = last[last_rng.integers(0, len(last), size)]
+        dom = domains[dom_rng.integers(0, len(domains), size)]
+
+        ids_l, scores_l = ids.tolist(), scores.tolist()
+        names = [f"{a} {b}" for a, b in zip(fn.tolist(), ln.tolist())]
+        emails = [f"{a.lower()}.{b.lower()}{i}@{d}" for a, b, i, d in zip(fn.tolist(), ln.tolist(), ids_l, dom.tolist())]
+        nats = np.where(local, "Singaporean", "Non-Singaporean").tolist()
+
+        credit = list(zip(ids_l, names, emails, scores_l))
+        account = list(zip(ids_l, names, nats, emails, status.tolist()))
+        pr = [(i, nm, em, int(p)) for i, nm, em, p, loc in zip(ids_l, names, emails, has_pr.tolist(), local.tolist())
+              if not loc]
+        yield credit, account, pr
+
+
+def load_synthetic(conn, n: int, seed: int):
+    """Bulk-load n synthetic customers: tuned PRAGMAs, big transactions, indexes built afterwards."""
+    cur = conn.cursor()
+    # WAL (what the app's read pool opens) keeps each committed batch intact if the
+    # load crashes; synchronous=OFF only skips the fsyncs
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=OFF")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-262144")  # 256 MB
+    for name in SECONDARY_INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name}")
+
+    t0 = time.perf_counter()
+    done = 0
+    for credit, account, pr in synthetic_batches(n, seed):
+        cur.execute("BEGIN")
+        cur.executemany("INSERT INTO credit_scores VALUES (?,?,?,?)", credit)
+        cur.executemany("INSERT INTO account_status VALUES (?,?,?,?,?)", account)
+        cur.executemany("INSERT INTO pr_status VALUES (?,?,?,?)", pr)
+        cur.execute("COMMIT")
+        done += len(credit)
+        print(f"  {done:,}/{n:,} customers ({done / (time.perf_counter() - t0):,.0f}/s)")
+
+    print("Building indexes...")
+    for name, cols in SECONDARY_INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {cols}")
+    cur.execute("ANALYZE")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--customers", type=int, default=0, help="synthetic customers to generate on top of the samples")
+    ap.add_argument("--seed", type=int, default=42, help="random seed for the synthetic data")
+    args = ap.parse_args()
+
+    print("Writing DB to:", DB_PATH)
+
+    # Autocommit mode: transactions are managed explicitly for the bulk load
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    cur = conn.cursor()
+
+    # Create tables
+    create_tables(cur)
+
     # Reset + insert
+    cur.execute("BEGIN")
     cur.execute("DELETE FROM credit_scores")
     cur.execute("DELETE FROM account_status")
     cur.execute("DELETE FROM pr_status")
@@ -66,7 +180,10 @@ def main():
     cur.executemany("INSERT INTO account_status VALUES (?,?,?,?,?)", ACCOUNT_ROWS)
     cur.executemany("INSERT INTO pr_status VALUES (?,?,?,?)", PR_ROWS)
 
-    conn.commit()
+    cur.execute("COMMIT")
+
+    if args.customers > 0:
+        load_synthetic(conn, args.customers, args.seed)
 
     # Verify counts
     for t in ["credit_scores", "account_status", "pr_status"]:
@@ -0,0 +1,53 @@
+"""
+Build or update the policy vector index from the command line.
+
+Meant for ingest boxes: extraction and embedding can be spread over
+several processes. The result is the same index the app builds serially.
+
+Usage:
+  python build_policy_index.py                          # incremental, serial
+  python build_policy_index.py --workers 32 --embed-workers 8 --embed-threads 4
+  python build_policy_index.py --rebuild                # re-index everything (caches are kept)
+  python build_policy_index.py --rebuild --no-cache     # cold build: also drop text/embedding caches
+"""
+import argparse
+import json
+import shutil
+import time
+
+import policy_rag
+from policy_index import describe_index, is_ivf
+from policy_ingest import INGEST_WORKERS, EMBED_WORKERS, EMBED_THREADS
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS, help="processes for PDF page extraction")
+    ap.add_argument("--embed-workers", type=int, default=EMBED_WORKERS, help="processes for chunk embedding")
+    ap.add_argument("--embed-threads", type=int, default=EMBED_THREADS, help="compute threads per embedding process")
+    ap.add_argument("--rebuild", action="store_true", help="drop the index and re-index every file")
+    ap.add_argument("--no-cache", action="store_true", help="with --rebuild, also drop cached text/embeddings")
+    args = ap.parse_args()
+
+    if args.rebuild:
+        for p in (policy_rag.MANIFEST_PATH, policy_rag.INDEX_PATH, policy_rag.META_PATH):
+            p.unlink(missing_ok=True)
+        if args.no_cache:
+            shutil.rmtree(policy_rag.CACHE_DIR, ignore_errors=True)
+
+    t0 = time.perf_counter()
+    index, meta, _, _ = policy_rag.build_or_load_index(
+        workers=args.workers,
+        embed_workers=args.embed_workers,
+        embed_threads=args.embed_threads,
+    )
+    elapsed = time.perf_counter() - t0
+    kind = describe_index(index)
+    if is_ivf(index):
+        manifest = json.loads(policy_rag.MANIFEST_PATH.read_text(encoding="utf-8"))
+        kind += f", trained on {manifest.get('ivf_trained_on', '?')} vectors"
+    print(f"Indexed {len(meta)} chunks ({index.ntotal} vectors, {kind}) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
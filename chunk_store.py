@@ -0,0 +1,174 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# One fixed-width row per chunk; the text itself lives in a separate blob
+META_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("source", "<i4"),     # index into the sources list
+    ("chunk_no", "<i4"),
+    ("text_off", "<i8"),   # byte offset into the text blob
+    ("text_len", "<i4"),   # byte length of the UTF-8 text
+    ("page_start", "<i4"),  # 1-based page range the chunk came from
+    ("page_end", "<i4"),
+    ("char_start", "<i8"),  # character span in the document's extracted text
+    ("char_end", "<i8"),
+])
+
+
+def _paths(base: Path):
+    return (
+        base.with_name(base.name + ".cols.npy"),
+        base.with_name(base.name + ".text.bin"),
+        base.with_name(base.name + ".sources.json"),
+    )
+
+
+class ChunkMetaStore:
+    """
+    Columnar chunk metadata, looked up by vector ID.
+    - <base>.cols.npy      fixed-width rows (see META_DTYPE), sorted by id
+    - <base>.text.bin      UTF-8 chunk texts back to back
+    - <base>.sources.json  source file names the source column points into
+    open() memory-maps the columns and the text blob, so loading costs
+    almost nothing and only the texts of returned hits are ever read.
+    """
+
+    def __init__(self, cols: np.ndarray, text, sources: List[str]):
+        self._cols = cols
+        self._text = text
+        self._sources = list(sources)
+
+    @classmethod
+    def empty(cls) -> "ChunkMetaStore":
+        return cls(np.empty(0, dtype=META_DTYPE), np.empty(0, dtype=np.uint8), [])
+
+    @classmethod
+    def open(cls, base: Path) -> Optional["ChunkMetaStore"]:
+        cols_path, text_path, sources_path = _paths(base)
+        if not (cols_path.exists() and text_path.exists() and sources_path.exists()):
+            return None
+        cols = np.load(str(cols_path), mmap_mode="r")
+        if cols.dtype != META_DTYPE:
+            return None
+        if text_path.stat().st_size:
+            text = np.memmap(str(text_path), dtype=np.uint8, mode="r")
+        else:
+            text = np.empty(0, dtype=np.uint8)
+        sources = json.loads(sources_path.read_text(encoding="utf-8"))
+        return cls(cols, text, sources)
+
+    def save(self, base: Path):
+        cols_path, text_path, sources_path = _paths(base)
+        tmp = [p.with_name(p.name + ".tmp") for p in (cols_path, text_path, sources_path)]
+        with open(tmp[0], "wb") as f:
+            np.save(f, np.ascontiguousarray(self._cols))
+        with open(tmp[1], "wb") as f:
+            f.write(memoryview(np.ascontiguousarray(self._text)))
+        tmp[2].write_text(json.dumps(self._sources), encoding="utf-8")
+        for t, p in zip(tmp, (cols_path, text_path, sources_path)):
+            os.replace(t, p)
+
+    def __len__(self) -> int:
+        return len(self._cols)
+
+    def _row(self, vid: int) -> Optional[int]:
+        ids = self._cols["id"]
+        row = int(np.searchsorted(ids, vid))
+        if row < len(ids) and ids[row] == vid:
+            return row
+        return None
+
+    def __contains__(self, vid: int) -> bool:
+        return self._row(vid) is not None
+
+    def _text_at(self, row: int) -> str:
+        off = int(self._cols["text_off"][row])
+        n = int(self._cols["text_len"][row])
+        return self._text[off:off + n].tobytes().decode("utf-8")
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        r = self._cols[row]
+        source = self._sources[int(r["source"])]
+        return {
+            "id": int(r["id"]),
+            "source": source,
+            "chunk_id": f"{source}::chunk{int(r['chunk_no'])}",
+            "page_start": int(r["page_start"]),
+            "page_end": int(r["page_end"]),
+            "char_start": int(r["char_start"]),
+            "char_end": int(r["char_end"]),
+            "text": self._text_at(row),
+        }
+
+    def get(self, vid: int) -> Optional[Dict[str, Any]]:
+        row = self._row(vid)
+        return None if row is None else self._record(row)
+
+    def __getitem__(self, vid: int) -> Dict[str, Any]:
+        rec = self.get(vid)
+        if rec is None:
+            raise KeyError(vid)
+        return rec
+
+    def ids(self) -> np.ndarray:
+        return np.asarray(self._cols["id"])
+
+    def ids_by_source(self) -> Dict[str, np.ndarray]:
+        src = np.asarray(self._cols["source"])
+        ids = np.asarray(self._cols["id"])
+        out = {}
+        for i in np.unique(src):
+            out[self._sources[int(i)]] = ids[src == i]
+        return out
+
+    def __iter__(self) -> Iterable[Dict[str, Any]]:
+        for row in range(len(self._cols)):
+            yield self._record(row)
+
+    def updated(self, remove_ids: Iterable[int], new_rows: List[Dict[str, Any]]) -> "ChunkMetaStore":
+        """
+        Return a new in-memory store with `remove_ids` dropped and `new_rows`
+        ({"id", "source", "chunk_no", "text", "page_start", "page_end",
+        "char_start", "char_end"}) appended. The text blob is
+        compacted by copying the kept byte runs, never decoding them.
+        """
+        cols = np.asarray(self._cols)
+        keep = ~np.isin(cols["id"], np.fromiter(remove_ids, dtype="int64"))
+        kept = cols[keep].copy()
+
+        # Copy kept texts as contiguous byte runs
+        blob_parts = []
+        if len(kept):
+            offs, lens = kept["text_off"], kept["text_len"].astype("int64")
+            breaks = np.flatnonzero(offs[1:] != offs[:-1] + lens[:-1]) + 1
+            starts = np.concatenate([[0], breaks])
+            ends = np.concatenate([breaks, [len(kept)]])
+            for s, e in zip(starts, ends):
+                blob_parts.append(self._text[offs[s]:offs[e - 1] + lens[e - 1]].tobytes())
+            kept["text_off"] = np.concatenate([[0], np.cumsum(lens)[:-1]])
+        pos = int(kept["text_len"].astype("int64").sum()) if len(kept) else 0
+
+        # Re-number sources so removed files drop out of the list
+        used = sorted({self._sources[int(i)] for i in np.unique(kept["source"])} | {r["source"] for r in new_rows})
+        src_no = {s: i for i, s in enumerate(used)}
+        if len(kept):
+            remap = np.array([src_no.get(s, -1) for s in self._sources], dtype="int32")
+            kept["source"] = remap[kept["source"]]
+
+        added = np.empty(len(new_rows), dtype=META_DTYPE)
+        for i, r in enumerate(new_rows):
+            b = r["text"].encode("utf-8")
+            added[i] = (r["id"], src_no[r["source"]], r["chunk_no"], pos, len(b),
+                        r.get("page_start", 0), r.get("page_end", 0), r.get("char_start", 0), r.get("char_end", 0))
+            blob_parts.append(b)
+            pos += len(b)
+
+        cols = np.concatenate([kept, added])
+        if len(cols) > 1 and np.any(np.diff(cols["id"]) <= 0):
+            cols = cols[np.argsort(cols["id"], kind="stable")]
+        text = np.frombuffer(b"".join(blob_parts), dtype=np.uint8)
+        return ChunkMetaStore(cols, text, used)
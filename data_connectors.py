@@ -1,19 +1,111 @@
+import json
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, Iterator, List
+
+from metrics import span
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "bank_systems.db"
 
+# Statements kept prepared per connection (sqlite3's own statement cache)
+STATEMENT_CACHE_SIZE = 128
+# Readers wait this long on a locked database (e.g. during a bulk load)
+BUSY_TIMEOUT_S = float(os.getenv("BANK_DB_BUSY_TIMEOUT", "30"))
+# Idle connections kept open for reuse
+POOL_SIZE = int(os.getenv("BANK_DB_POOL_SIZE", "8"))
+
+
+class ConnectionPool:
+    """
+    Pool of persistent read-only SQLite connections, shared by all threads.
+    - Opened with a mode=ro URI, so the simulated systems DB can't be
+      written through the connectors
+    - The first open switches the file to WAL so readers never block on a
+      writer (bootstrap_db) and vice versa; the setting sticks to the file
+    - Each connection keeps its prepared statements cached
+    - A connection is checked out for one query at a time, so Streamlit's
+      per-rerun script threads reuse connections instead of leaking one
+      each; at most `max_idle` are kept open
+    - After a fork the child starts a fresh pool (multi-worker servers)
+    """
+
+    def __init__(self, path: Path = DB_PATH, max_idle: int = POOL_SIZE):
+        self.path = Path(path)
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._pid = os.getpid()
+        self._wal_checked = False
+        self.opened = 0
+
+    def _ensure_wal(self):
+        with self._lock:
+            if self._wal_checked:
+                return
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+            self._wal_checked = True
+
+    def _open(self) -> sqlite3.Connection:
+        if not self.path.exists():
+            raise FileNotFoundError(f"Bank systems DB not found: {self.path} (run bootstrap_db.py)")
+        self._ensure_wal()
+        conn = sqlite3.connect(
+            f"{self.path.as_uri()}?mode=ro",
+            uri=True,
+            timeout=BUSY_TIMEOUT_S,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA query_only=ON")
+        self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        if os.getpid() != self._pid:
+            # Forked child: never touch the parent's connections
+            self._lock = threading.Lock()
+            self._idle, self._pid = [], os.getpid()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._wal_checked = False
+        for conn in idle:
+            conn.close()
+
+
+_POOL = ConnectionPool()
+
+def get_pool() -> ConnectionPool:
+    return _POOL
 
 
 def _fetchone(query: str, params: tuple) -> Optional[tuple]:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(query, params)
-    row = cur.fetchone()
-    conn.close()
-    return row
+    with span("db_lookup"), _POOL.connection() as conn:
+        return conn.execute(query, params).fetchone()
 
 def get_credit_record(customer_id: int) -> Optional[Dict[str, Any]]:
     row = _fetchone(
@@ -41,3 +133,51 @@ def get_pr_status(customer_id: int) -> Optional[bool]:
     if not row:
         return None
     return bool(row[0])
+
+# One row per customer; account data is required, PR status is optional
+_PROFILE_SELECT = """
+SELECT c.id, c.name, c.email, c.credit_score, a.nationality, a.account_status, p.pr_status
+FROM credit_scores c
+JOIN account_status a ON a.id = c.id
+LEFT JOIN pr_status p ON p.id = c.id
+"""
+
+# IDs are passed as one JSON array parameter, so every chunk reuses the same prepared statement
+PROFILE_CHUNK = 5000
+
+
+def _profile(row: tuple) -> Dict[str, Any]:
+    customer = {
+        "id": row[0],
+        "name": row[1],
+        "email": row[2],
+        "credit_score": row[3],
+        "nationality": row[4],
+        "account_status": row[5],
+    }
+    # PR status only matters (and is only reported) for non-Singaporeans
+    if (row[4] or "").lower() != "singaporean":
+        customer["pr_status"] = None if row[6] is None else bool(row[6])
+    return customer
+
+def get_customer_profile(customer_id: int) -> Optional[Dict[str, Any]]:
+    """Credit, account and PR data for one customer in a single query (None if not found)."""
+    row = _fetchone(_PROFILE_SELECT + "WHERE c.id=?", (customer_id,))
+    return _profile(row) if row else None
+
+def get_customer_profiles(customer_ids: Iterable[int], chunk_size: int = PROFILE_CHUNK) -> Iterator[Dict[str, Any]]:
+    """
+    Stream profiles for many customers, chunk_size IDs per query, in input
+    order. IDs that aren't found are skipped.
+    """
+    query = (_PROFILE_SELECT.replace("FROM credit_scores c", "FROM json_each(?) j\nJOIN credit_scores c ON c.id = j.value")
+             + "ORDER BY j.key")
+    it = iter(customer_ids)
+    while True:
+        chunk = [int(i) for i in islice(it, chunk_size)]
+        if not chunk:
+            return
+        with span("db_lookup_batch"), _POOL.connection() as conn:
+            rows = conn.execute(query, (json.dumps(chunk),)).fetchall()
+        for row in rows:
+            yield _profile(row)
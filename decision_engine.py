@@ -1,9 +1,17 @@
+import asyncio
 import json
-import os
-from typing import Dict, Any, List
+import queue
+import time
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import re
+from concurrent.futures import ThreadPoolExecutor
 
-import google.generativeai as genai
+from gemini_client import get_client
+from llm_cache import decision_key, get_cache
+from llm_executor import get_executor
+from metrics import inc, observe, span
+from json_stream import IncrementalJSONParser
+from prompt_builder import build_prompt
 
 SYSTEM_INSTRUCTIONS = """You are a bank loan risk assistant.
 Rules:
@@ -18,12 +26,6 @@ Recommendation policy:
 Return ONLY JSON.
 """
 
-PREFERRED_ORDER = [
-    "models/gemini-2.5-flash",
-    "models/gemini-2.5-pro",
-]
-
-
 def _extract_json(text: str) -> str:
     text = (text or "").strip()
 
@@ -38,6 +40,16 @@ def _extract_json(text: str) -> str:
 
     return text
 
+def build_rag_query(customer: Dict[str, Any]) -> str:
+    """Retrieval query used to fetch policy evidence for a customer."""
+    return f"""
+    Determine overall risk and interest rate for:
+    credit_score={customer['credit_score']},
+    account_status={customer['account_status']},
+    nationality={customer['nationality']},
+    pr_status={customer.get('pr_status')}
+    """
+
 def deterministic_recommendation(customer: dict, overall_risk: str) -> str:
     nat = (customer.get("nationality") or "").lower()
     acct = (customer.get("account_status") or "").lower()
@@ -60,62 +72,21 @@ def deterministic_recommendation(customer: dict, overall_risk: str) -> str:
 
 
 def pick_model_name() -> str:
-    available = {m.name: m for m in genai.list_models()}
-    for name in PREFERRED_ORDER:
-        m = available.get(name)
-        if m and "generateContent" in getattr(m, "supported_generation_methods", []):
-            return name
-    for m in available.values():
-        if "generateContent" in getattr(m, "supported_generation_methods", []):
-            return m.name
-    raise RuntimeError("No available Gemini models support generateContent for this API key.")
-
-def call_gemini(customer: Dict[str, Any], evidence: List[Dict[str, Any]]) -> Dict[str, Any]:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Missing GEMINI_API_KEY env var.")
-    genai.configure(api_key=api_key)
-
-    model_name = pick_model_name()
-
-    evidence_block = [{
-        "chunk_id": e["chunk_id"],
-        "source": e["source"],
-        "text": e["text"][:900],
-    } for e in evidence]
-
-    prompt = {
-        "task": "Assess overall risk level and interest rate, and produce rationale grounded in evidence.",
-        "customer": customer,
-        "policy_evidence": evidence_block,
-        "required_output_json_schema": {
-            "customer_id": "int",
-            "overall_risk": "low|medium|high|unknown",
-            "interest_rate": "string percent or 'unknown'",
-            "recommendation": "approve|do_not_recommend|needs_manual_review",
-            "rationale": "string",
-            "evidence_used": [{"chunk_id": "string", "why_used": "string"}],
-            "assumptions_or_gaps": ["string"]
-        }
-    }
-
-    model = genai.GenerativeModel(
-        model_name=model_name,
-        system_instruction=SYSTEM_INSTRUCTIONS
-    )
-
-    resp = model.generate_content(json.dumps(prompt))
-    raw = (resp.text or "").strip()
+    # Resolved once and cached by the shared client (see gemini_client)
+    return get_client().model_name()
 
+def parse_result(customer: Dict[str, Any], raw: str, model_name: str) -> Tuple[Dict[str, Any], bool]:
+    """Model text -> result dict; the flag is False when it had to fall back to manual review."""
     try:
         cleaned = _extract_json(raw)
         result = json.loads(cleaned)
+        result["customer_id"] = customer.get("id")
 
         result["recommendation"] = deterministic_recommendation(
             customer,
             (result.get("overall_risk") or "unknown").lower()
         )
-        return result
+        return result, True
     except Exception as e:
         return {
             "customer_id": customer.get("id"),
@@ -125,4 +96,222 @@ def call_gemini(customer: Dict[str, Any], evidence: List[Dict[str, Any]]) -> Dic
             "rationale": f"Model output was not valid JSON even after cleaning. Used model: {model_name}. Error: {type(e).__name__}",
             "evidence_used": [],
             "assumptions_or_gaps": [raw[:2000]],
-        }
+        }, False
+
+
+# Result fields a policy-table decision fixes; with llm_rationale Gemini only adds the rest
+RULE_FIELDS = ("overall_risk", "interest_rate", "recommendation")
+
+Update = Dict[str, Any]  # {"fields": completed fields so far, "partial": {field: text so far}}
+
+
+def _stream_relay(customer: Dict[str, Any], on_update: Callable[[Update], Any]) -> Callable[[str, int], None]:
+    """Executor on_text callback: parses the streamed reply and reports fields as they complete."""
+    parser, current = None, None
+    t0 = time.perf_counter()
+
+    def on_text(text: str, attempt: int):
+        nonlocal parser, current
+        if current is None:
+            observe("llm_first_token_seconds", time.perf_counter() - t0)
+        if attempt != current:
+            parser, current = IncrementalJSONParser(), attempt  # retried: start over
+        new = parser.feed(text)
+        partial = parser.partial()
+        if not new and partial is None:
+            return
+        fields = dict(parser.fields)
+        fields.pop("recommendation", None)
+        if "overall_risk" in fields:
+            # Same override parse_result applies to the final result
+            fields["recommendation"] = deterministic_recommendation(customer, str(fields["overall_risk"]).lower())
+        live = {partial[0]: partial[1]} if partial and partial[0] != "recommendation" else {}
+        on_update({"fields": fields, "partial": live})
+
+    return on_text
+
+
+# The decision cache is SQLite and can wait up to 30 s on another process's
+# write lock; its calls run on their own threads so they never hold up the
+# event loop (or the default thread pool the pipeline stages use)
+_CACHE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-cache")
+
+def _cache_get(cache, index_id: Optional[str], key: str) -> Optional[Dict[str, Any]]:
+    cache.bind_index(index_id)
+    return cache.get(key)
+
+
+async def call_gemini_async(
+    customer: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    use_cache: bool = True,
+    index_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+    on_update: Optional[Callable[[Update], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Gemini decision for a customer + evidence set, run through the shared
+    rate-limited executor (llm_executor). The prompt is packed to a token
+    budget (prompt_builder) and token usage is returned under "usage".
+    Parsed results are cached on disk by prompt content (llm_cache), so
+    customers with the same decision fields share an entry; `index_id` is
+    the policy index build the evidence came from, and a new build
+    empties the cache. `timeout` is the deadline for the call including
+    retries. With `on_update` the reply is streamed and on_update(update)
+    is called (on the executor loop) each time a field completes or the
+    string being written grows; the returned result is still parsed from
+    the full reply.
+    """
+    client = get_client()
+    model_name = await asyncio.to_thread(client.model_name)
+    prompt = build_prompt(customer, evidence)
+    cache = get_cache() if use_cache else None
+    key = None
+    loop = asyncio.get_running_loop()
+    if cache is not None:
+        key = decision_key(model_name, SYSTEM_INSTRUCTIONS, prompt["customer"], prompt["evidence"])
+        hit = await loop.run_in_executor(_CACHE_POOL, _cache_get, cache, index_id, key)
+        if hit is not None:
+            hit["customer_id"] = customer.get("id")
+            hit["cached"] = True
+            return hit
+
+    on_text = _stream_relay(customer, on_update) if on_update is not None else None
+    with span("llm", mode="call" if on_text is None else "stream"):
+        resp = await get_executor().generate(prompt["text"], SYSTEM_INSTRUCTIONS, timeout=timeout, on_text=on_text)
+    raw = (resp.text or "").strip()
+    result, ok = parse_result(customer, raw, model_name)
+    usage = getattr(resp, "usage_metadata", None)
+    result["usage"] = {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or prompt["stats"]["prompt_tokens_est"],
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        **prompt["stats"],
+    }
+    if ok and cache is not None:
+        await loop.run_in_executor(_CACHE_POOL, cache.put, key, model_name, result)
+    return result
+
+
+def call_gemini(
+    customer: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    use_cache: bool = True,
+    index_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Blocking call_gemini_async()."""
+    return get_executor().run(call_gemini_async(customer, evidence, use_cache, index_id, timeout))
+
+
+def rule_based_result(customer: Dict[str, Any], decision: Dict[str, Any]) -> Dict[str, Any]:
+    """Full result dict (same shape as call_gemini) from a policy rule-table decision."""
+    risk = decision["overall_risk"]
+    recommendation = deterministic_recommendation(customer, risk)
+    steps = "; ".join(f"{ev['why_used']} ({ev['chunk_id']})" for ev in decision["evidence_used"])
+    return {
+        "customer_id": customer.get("id"),
+        "overall_risk": risk,
+        "interest_rate": decision["interest_rate"],
+        "recommendation": recommendation,
+        "rationale": f"Decided from the policy tables: {steps}. Recommendation: {recommendation}.",
+        "evidence_used": decision["evidence_used"],
+        "assumptions_or_gaps": [],
+        "decided_by": "policy_rules",
+    }
+
+
+def _decided(result: Dict[str, Any]) -> Dict[str, Any]:
+    inc("decisions_total", decided_by=result.get("decided_by", "?"))
+    return result
+
+
+async def assess_async(
+    customer: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    rules=None,
+    llm_rationale: bool = False,
+    index_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+    on_update: Optional[Callable[[Update], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Decide overall risk / interest rate from the compiled policy tables
+    (policy_rules.PolicyRules) when they cover the customer, and only call
+    Gemini when they don't. With llm_rationale=True Gemini still writes the
+    rationale, but the table's risk and rate are kept. `on_update` streams
+    the Gemini call (see call_gemini_async).
+    """
+    decision = rules.decide(customer) if rules is not None else None
+    if decision is None:
+        result = await call_gemini_async(customer, evidence, index_id=index_id, timeout=timeout, on_update=on_update)
+        result["decided_by"] = "llm"
+        return _decided(result)
+
+    result = rule_based_result(customer, decision)
+    if llm_rationale:
+        fixed = {k: result[k] for k in RULE_FIELDS}
+
+        def relay_rationale(update: Update):
+            extra = {k: v for k, v in update["fields"].items() if k not in RULE_FIELDS}
+            on_update({"fields": {**extra, **fixed},
+                       "partial": {k: v for k, v in update["partial"].items() if k not in RULE_FIELDS}})
+
+        if on_update is not None:
+            on_update({"fields": dict(fixed), "partial": {}})
+        relay = relay_rationale if on_update is not None else None
+        llm = await call_gemini_async(customer, evidence, index_id=index_id, timeout=timeout, on_update=relay)
+        cited = {ev["chunk_id"] for ev in result["evidence_used"]}
+        result["rationale"] = llm.get("rationale") or result["rationale"]
+        result["evidence_used"] += [ev for ev in llm.get("evidence_used", []) if ev.get("chunk_id") not in cited]
+        result["assumptions_or_gaps"] = llm.get("assumptions_or_gaps", [])
+        result["decided_by"] = "policy_rules+llm_rationale"
+    return _decided(result)
+
+
+def assess(
+    customer: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    rules=None,
+    llm_rationale: bool = False,
+    index_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Blocking assess_async(); table-covered cases never touch the executor."""
+    decision = rules.decide(customer) if rules is not None else None
+    if decision is not None and not llm_rationale:
+        return _decided(rule_based_result(customer, decision))
+    return get_executor().run(assess_async(customer, evidence, rules, llm_rationale, index_id, timeout))
+
+
+_DONE = object()
+
+def assess_stream(
+    customer: Dict[str, Any],
+    evidence: List[Dict[str, Any]],
+    rules=None,
+    llm_rationale: bool = False,
+    index_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    assess() for interactive callers: yields updates ({"fields", "partial"},
+    see call_gemini_async) in the caller's thread while Gemini is still
+    writing, then a last one that also carries the full "result".
+    """
+    decision = rules.decide(customer) if rules is not None else None
+    if decision is not None and not llm_rationale:
+        result = _decided(rule_based_result(customer, decision))
+        yield {"fields": result, "partial": {}, "result": result}
+        return
+
+    updates: "queue.Queue" = queue.Queue()
+    fut = get_executor().submit(assess_async(customer, evidence, rules, llm_rationale, index_id, timeout,
+                                             on_update=updates.put))
+    fut.add_done_callback(lambda _: updates.put(_DONE))
+    while True:
+        update = updates.get()
+        if update is _DONE:
+            break
+        yield update
+    result = fut.result()
+    yield {"fields": result, "partial": {}, "result": result}
@@ -0,0 +1,164 @@
+import inspect
+import os
+from pathlib import Path
+from typing import List, Protocol
+
+import numpy as np
+
+# Which implementation embeds policy chunks and queries:
+# - torch     : sentence-transformers on PyTorch (default)
+# - onnx      : exported ONNX model on ONNX Runtime, no torch import needed
+# - onnx-int8 : same, with dynamically int8-quantized weights
+EMBED_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("POLICY_EMBED_BACKEND", "torch").lower()
+ONNX_DIR = Path(os.getenv("POLICY_ONNX_DIR", "models/all-MiniLM-L6-v2-onnx"))
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2's sentence-transformers setting
+
+
+class Embedder(Protocol):
+    def encode(self, sentences: List[str], normalize_embeddings: bool = ..., batch_size: int = ...,
+               show_progress_bar: bool = ...) -> np.ndarray: ...
+
+    def get_sentence_embedding_dimension(self) -> int: ...
+
+
+class OnnxEmbedder:
+    """
+    Drop-in for the parts of SentenceTransformer that policy_rag uses:
+    Rust tokenizer + ONNX Runtime session + mean pooling + L2 normalisation.
+    """
+
+    def __init__(self, model_dir: Path = ONNX_DIR, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = Path(model_dir) / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+        tok_path = Path(model_dir) / TOKENIZER_FILE
+        if not model_path.exists() or not tok_path.exists():
+            raise RuntimeError(
+                f"ONNX embedding model not found in {model_dir}. "
+                "Export it with: python bench_embedding_backends.py --export"
+            )
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(str(model_path), opts, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._dim = int(self._session.get_outputs()[0].shape[-1])
+
+        self._tokenizer = Tokenizer.from_file(str(tok_path))
+        self._tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self._tokenizer.enable_padding()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        enc = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in enc], dtype="int64")
+        mask = np.array([e.attention_mask for e in enc], dtype="int64")
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self._session.run(None, feeds)[0]
+        # Mean pooling over real tokens
+        m = mask[..., None].astype("float32")
+        return (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+
+    def encode(self, sentences: List[str], normalize_embeddings: bool = False, batch_size: int = 32,
+               show_progress_bar: bool = False, **_) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        if not sentences:
+            return np.empty((0, self._dim), dtype="float32")
+        # Sort by length so each batch pads as little as possible
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        out = np.empty((len(sentences), self._dim), dtype="float32")
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([sentences[i] for i in idx])
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def load_embedder(model_name: str, backend: str = EMBED_BACKEND, threads: int = 0) -> Embedder:
+    backend = (backend or "torch").lower()
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBED_BACKENDS}")
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+    return OnnxEmbedder(ONNX_DIR, quantized=backend == "onnx-int8", threads=threads)
+
+
+def backend_model_id(model_name: str, backend: str = EMBED_BACKEND) -> str:
+    """
+    Identity used for index/embedding caches. Vectors from different
+    backends are close but not identical, so they are never mixed.
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def export_onnx(model_name: str, out_dir: Path = ONNX_DIR, quantize: bool = True) -> Path:
+    """
+    One-off export of the transformer to ONNX (needs torch + transformers),
+    plus an int8 dynamically-quantized copy. Writes model.onnx,
+    model_int8.onnx and tokenizer.json into out_dir.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.backend_tokenizer.save(str(out_dir / TOKENIZER_FILE))
+
+    class _LastHidden(torch.nn.Module):
+        # Keyword call + single tensor output keeps the export stable across transformers versions
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            kwargs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if token_type_ids is not None:
+                kwargs["token_type_ids"] = token_type_ids
+            return self.inner(**kwargs).last_hidden_state
+
+    sample = tokenizer(["policy export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "seq"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+    extra = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        extra["dynamo"] = False  # newer torch defaults to the dynamo exporter
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHidden(model),
+            tuple(sample[n] for n in names),
+            str(out_dir / ONNX_FILE),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=17,
+            **extra,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(out_dir / ONNX_FILE), str(out_dir / ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    return out_dir
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+from google.api_core import exceptions as gexc
+
+PREFERRED_ORDER = [
+    "models/gemini-2.5-flash",
+    "models/gemini-2.5-pro",
+]
+
+# How long a resolved model name is trusted before the catalog is listed again
+MODEL_TTL_SECONDS = float(os.getenv("GEMINI_MODEL_TTL", "3600"))
+
+# Errors that mean the cached model is gone or not usable with this key
+_STALE_MODEL_ERRORS = (gexc.NotFound, gexc.PermissionDenied, gexc.FailedPrecondition)
+
+
+class GeminiClient:
+    """
+    Process-wide Gemini access shared by every Streamlit session.
+    - genai.configure() runs once per API key
+    - The model picked from genai.list_models() is cached for MODEL_TTL_SECONDS
+      and re-resolved early if a call fails with a stale-model error
+    - GenerativeModel instances are reused per (model, system instruction)
+    """
+
+    def __init__(self, api_key: str, preferred: List[str] = PREFERRED_ORDER, ttl: float = MODEL_TTL_SECONDS):
+        self.api_key = api_key
+        self._preferred = list(preferred)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._model_name: Optional[str] = None
+        self._resolved_at = 0.0
+        self._models: Dict[Tuple[str, Optional[str]], Any] = {}
+        self._catalog_calls = 0
+        self._refreshes = 0
+        genai.configure(api_key=api_key)
+
+    def _resolve(self) -> str:
+        available = {m.name: m for m in genai.list_models()}
+        self._catalog_calls += 1
+        for name in self._preferred:
+            m = available.get(name)
+            if m and "generateContent" in getattr(m, "supported_generation_methods", []):
+                return name
+        for m in available.values():
+            if "generateContent" in getattr(m, "supported_generation_methods", []):
+                return m.name
+        raise RuntimeError("No available Gemini models support generateContent for this API key.")
+
+    def model_name(self) -> str:
+        with self._lock:
+            if self._model_name is None or time.monotonic() - self._resolved_at > self._ttl:
+                name = self._resolve()
+                if name != self._model_name:
+                    self._models.clear()
+                self._model_name, self._resolved_at = name, time.monotonic()
+            return self._model_name
+
+    def invalidate(self):
+        """Forget the resolved model so the next call lists the catalog again."""
+        with self._lock:
+            self._model_name = None
+            self._models.clear()
+            self._refreshes += 1
+
+    def model(self, system_instruction: Optional[str] = None):
+        name = self.model_name()
+        key = (name, system_instruction)
+        with self._lock:
+            m = self._models.get(key)
+            if m is None:
+                m = genai.GenerativeModel(model_name=name, system_instruction=system_instruction)
+                self._models[key] = m
+            return m
+
+    def generate(self, prompt: str, system_instruction: Optional[str] = None, **kwargs):
+        """generate_content() on the cached model; one retry with a fresh model on stale-model errors."""
+        try:
+            return self.model(system_instruction).generate_content(prompt, **kwargs)
+        except _STALE_MODEL_ERRORS:
+            self.invalidate()
+            return self.model(system_instruction).generate_content(prompt, **kwargs)
+
+    async def generate_async(self, prompt: str, system_instruction: Optional[str] = None, **kwargs):
+        """Async generate_content(); resolving the model (rarely a network call) runs off the event loop."""
+        model = await asyncio.to_thread(self.model, system_instruction)
+        try:
+            return await model.generate_content_async(prompt, **kwargs)
+        except _STALE_MODEL_ERRORS:
+            self.invalidate()
+            model = await asyncio.to_thread(self.model, system_instruction)
+            return await model.generate_content_async(prompt, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self._model_name,
+                "model_age_s": round(time.monotonic() - self._resolved_at, 1) if self._model_name else None,
+                "catalog_calls": self._catalog_calls,
+                "refreshes": self._refreshes,
+                "cached_models": len(self._models),
+            }
+
+
+_CLIENT: Optional[GeminiClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_client() -> GeminiClient:
+    """Shared GeminiClient for GEMINI_API_KEY (re-created if the key changes)."""
+    global _CLIENT
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("Missing GEMINI_API_KEY env var.")
+    client = _CLIENT
+    if client is None or client.api_key != api_key:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT.api_key != api_key:
+                _CLIENT = GeminiClient(api_key)
+            client = _CLIENT
+    return client
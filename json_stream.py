@@ -0,0 +1,113 @@
+import json
+from typing import Any, Dict, Optional, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Top-level fields of a JSON object that arrives in pieces (a streamed
+    model reply). feed() returns the fields the new text completed; text
+    before the opening brace (e.g. a ```json fence) is skipped. partial()
+    gives the string value currently being written, so long fields such as
+    the rationale can be shown while they are still arriving.
+    Only the top level is tracked; nested values are decoded once complete.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.fields: Dict[str, Any] = {}
+        self._pos = 0
+        self._state = "seek"  # seek -> key -> key_str -> colon -> value_start -> value -> after_value ... -> done
+        self._key: Optional[str] = None
+        self._start = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def _emit(self, end: int, out: Dict[str, Any]):
+        try:
+            value = json.loads(self.buf[self._start:end])
+        except ValueError:
+            return
+        self.fields[self._key] = out[self._key] = value
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        self.buf += text
+        out: Dict[str, Any] = {}
+        buf = self.buf
+        while self._pos < len(buf) and self._state != "done":
+            ch = buf[self._pos]
+            state = self._state
+
+            if state == "seek":
+                if ch == "{":
+                    self._state = "key"
+            elif state in ("key", "after_value"):
+                if ch == '"' and state == "key":
+                    self._start, self._esc, self._state = self._pos, False, "key_str"
+                elif ch == ",":
+                    self._state = "key"
+                elif ch == "}":
+                    self._state = "done"
+            elif state == "key_str":
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._key = json.loads(buf[self._start:self._pos + 1])
+                    self._state = "colon"
+            elif state == "colon":
+                if ch == ":":
+                    self._state = "value_start"
+            elif state == "value_start":
+                if not ch.isspace():
+                    self._start, self._depth, self._in_str, self._esc = self._pos, 0, False, False
+                    self._state = "value"
+                    continue  # the first character belongs to the value
+            elif state == "value":
+                if self._in_str:
+                    if self._esc:
+                        self._esc = False
+                    elif ch == "\\":
+                        self._esc = True
+                    elif ch == '"':
+                        self._in_str = False
+                        if self._depth == 0:
+                            self._emit(self._pos + 1, out)
+                            self._state = "after_value"
+                elif ch == '"':
+                    self._in_str = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    if self._depth == 0:
+                        # Closing brace of the object ends a bare number/literal
+                        self._emit(self._pos, out)
+                        self._state = "done"
+                    else:
+                        self._depth -= 1
+                        if self._depth == 0:
+                            self._emit(self._pos + 1, out)
+                            self._state = "after_value"
+                elif ch == "," and self._depth == 0:
+                    self._emit(self._pos, out)
+                    self._state = "key"
+            self._pos += 1
+        return out
+
+    def partial(self) -> Optional[Tuple[str, str]]:
+        """(key, text so far) while a top-level string value is being written, else None."""
+        if self._state != "value" or not self._in_str or self._depth:
+            return None
+        raw = self.buf[self._start + 1:self._pos]
+        # The text may end inside an escape sequence (at most 5 chars of "\\uXXXX")
+        for cut in range(6):
+            try:
+                return self._key, json.loads(f'"{raw[:len(raw) - cut]}"')
+            except ValueError:
+                continue
+        return self._key, ""
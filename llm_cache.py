@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from metrics import inc
+
+BASE_DIR = Path(__file__).resolve().parent
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", str(BASE_DIR / "llm_cache" / "decisions.sqlite")))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))   # seconds; 0 disables the cache
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+def decision_key(model: str, instructions: str, customer: Dict[str, Any], evidence: List[Dict[str, Any]]) -> str:
+    """Content address of one Gemini decision: model, prompt version, customer fields and evidence."""
+    payload = {
+        "model": model,
+        "instructions": hashlib.sha256(instructions.encode("utf-8")).hexdigest(),
+        "customer": customer,
+        "evidence": [[e.get("chunk_id"), hashlib.sha256((e.get("text") or "").encode("utf-8")).hexdigest()]
+                     for e in evidence],
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    """
+    SQLite-backed cache of parsed Gemini decisions, keyed by decision_key().
+    - Entries expire after `ttl` seconds; beyond `max_entries` the least
+      recently used are evicted on write
+    - bind_index() drops everything when the policy index build changes
+    - Hit/miss counters are per process (see stats())
+    """
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._bound_index: Optional[str] = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS decisions (
+              key TEXT PRIMARY KEY,
+              model TEXT,
+              created REAL,
+              last_used REAL,
+              hits INTEGER DEFAULT 0,
+              result TEXT
+            )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS decisions_last_used ON decisions(last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_info (name TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per operation; commits on success
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT created, result FROM decisions WHERE key=?", (key,)).fetchone()
+            if row and now - row[0] <= self.ttl:
+                conn.execute("UPDATE decisions SET last_used=?, hits=hits+1 WHERE key=?", (now, key))
+            elif row:
+                conn.execute("DELETE FROM decisions WHERE key=?", (key,))
+                row = None
+        with self._lock:
+            if row:
+                self._hits += 1
+            else:
+                self._misses += 1
+        inc("cache_requests_total", cache="llm_decision", result="hit" if row else "miss")
+        return json.loads(row[1]) if row else None
+
+    def put(self, key: str, model: str, result: Dict[str, Any]):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO decisions (key, model, created, last_used, hits, result) VALUES (?,?,?,?,0,?)",
+                (key, model, now, now, json.dumps(result)),
+            )
+            evicted = conn.execute("DELETE FROM decisions WHERE created < ?", (now - self.ttl,)).rowcount
+            n = conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+            if n > self.max_entries:
+                evicted += conn.execute(
+                    "DELETE FROM decisions WHERE key IN (SELECT key FROM decisions ORDER BY last_used LIMIT ?)",
+                    (n - self.max_entries,),
+                ).rowcount
+        if evicted:
+            with self._lock:
+                self._evictions += evicted
+
+    def bind_index(self, index_id: Optional[str]):
+        """Clear the cache if it was filled against a different policy index build."""
+        if not index_id or index_id == self._bound_index:
+            return
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache_info WHERE name='index_id'").fetchone()
+            if row is None or row[0] != index_id:
+                conn.execute("DELETE FROM decisions")
+                conn.execute("INSERT OR REPLACE INTO cache_info VALUES ('index_id', ?)", (index_id,))
+        self._bound_index = index_id
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM decisions")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            n = conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": n,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else 0.0,
+                "evictions": self._evictions,
+                "ttl_seconds": self.ttl,
+                "max_entries": self.max_entries,
+            }
+
+
+_CACHE: Optional[DecisionCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_cache() -> DecisionCache:
+    """Process-wide DecisionCache."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = DecisionCache()
+    return _CACHE
@@ -0,0 +1,226 @@
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from google.api_core import exceptions as gexc
+
+from gemini_client import get_client
+from metrics import TOKEN_BUCKETS, inc, observe
+
+# Quota knobs (per process). 0 disables the corresponding limit.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))            # requests per minute
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "250000"))        # tokens per minute (prompt + output)
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))    # seconds per call, retries included
+
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 30.0
+EXPECTED_OUTPUT_TOKENS = 1024  # reserved per call until the real usage is known
+
+# Quota, overload and transient server errors are worth retrying
+RETRYABLE_ERRORS = (
+    gexc.ResourceExhausted,
+    gexc.TooManyRequests,
+    gexc.ServiceUnavailable,
+    gexc.InternalServerError,
+    gexc.DeadlineExceeded,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for rate limiting
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Continuous-refill token bucket; `per_minute` <= 0 means unlimited."""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, n: float = 1.0) -> float:
+        """Wait until `n` tokens are available and take them; returns seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        n = min(n, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return waited
+                delay = (n - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def adjust(self, n: float):
+        """Charge (or refund, if negative) tokens after the fact."""
+        if self.rate > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+
+
+class GeminiExecutor:
+    """
+    Async executor for Gemini generate calls, shared by the whole process.
+    - Runs on its own event loop thread, so sync callers, Streamlit sessions
+      and other event loops all share one set of limits
+    - At most `max_concurrency` calls in flight
+    - Token buckets for requests/min and tokens/min (prompt estimate plus
+      EXPECTED_OUTPUT_TOKENS, corrected from usage_metadata afterwards)
+    - Retryable errors back off exponentially with full jitter
+    - `timeout` is a deadline for the whole call, retries included
+    - With `on_text`, the response is streamed and each piece of text is
+      passed to on_text(text, attempt) on the executor loop; a retry starts
+      a new attempt number, so consumers know to discard earlier pieces
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        rpm: float = GEMINI_RPM,
+        tpm: float = GEMINI_TPM,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        timeout: float = GEMINI_TIMEOUT,
+    ):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="gemini-executor", daemon=True).start()
+        self._sem = asyncio.Semaphore(max(1, max_concurrency))
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._stats_lock = threading.Lock()
+        self._counts = {"calls": 0, "ok": 0, "failed": 0, "retries": 0, "timeouts": 0,
+                        "in_flight": 0, "throttled_s": 0.0, "tokens": 0, "prompt_tokens": 0}
+
+    def _bump(self, **delta):
+        with self._stats_lock:
+            for k, v in delta.items():
+                self._counts[k] += v
+
+    async def _stream(self, prompt: str, system_instruction: Optional[str], on_text: Callable[[str, int], Any],
+                      attempt: int, kwargs):
+        resp = await get_client().generate_async(prompt, system_instruction, stream=True, **kwargs)
+        async for chunk in resp:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # e.g. a final chunk with only the finish reason
+            if text:
+                on_text(text, attempt)
+        return resp
+
+    async def _attempt(self, prompt: str, system_instruction: Optional[str], deadline: float, kwargs,
+                       on_text: Optional[Callable[[str, int], Any]] = None, attempt: int = 0):
+        reserved = estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS
+        waited = await self._requests.acquire(1)
+        waited += await self._tokens.acquire(reserved)
+        self._bump(throttled_s=waited)
+        if waited:
+            inc("llm_throttled_seconds_total", waited)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        async with self._sem:
+            self._bump(in_flight=1)
+            try:
+                if on_text is None:
+                    call = get_client().generate_async(prompt, system_instruction, **kwargs)
+                else:
+                    call = self._stream(prompt, system_instruction, on_text, attempt, kwargs)
+                resp = await asyncio.wait_for(call, remaining)
+            finally:
+                self._bump(in_flight=-1)
+        usage = getattr(resp, "usage_metadata", None)
+        used = getattr(usage, "total_token_count", 0) or 0
+        if used:
+            self._tokens.adjust(used - reserved)
+            prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+            self._bump(tokens=used, prompt_tokens=prompt_tokens)
+            inc("llm_tokens_total", prompt_tokens, kind="prompt")
+            inc("llm_tokens_total", used - prompt_tokens, kind="output")
+            observe("llm_prompt_tokens", prompt_tokens, buckets=TOKEN_BUCKETS)
+        return resp
+
+    async def _generate(self, prompt: str, system_instruction: Optional[str], timeout: Optional[float], kwargs,
+                        on_text: Optional[Callable[[str, int], Any]] = None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._bump(calls=1)
+        attempt = 0
+        while True:
+            try:
+                resp = await self._attempt(prompt, system_instruction, deadline, kwargs, on_text, attempt)
+                self._bump(ok=1)
+                return resp
+            except RETRYABLE_ERRORS as e:
+                delay = random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+                if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    self._bump(failed=1, timeouts=int(isinstance(e, asyncio.TimeoutError)))
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise TimeoutError(f"Gemini call exceeded its {timeout or self.timeout:.0f}s deadline") from e
+                    raise
+                attempt += 1
+                self._bump(retries=1)
+                inc("llm_retries_total", error=type(e).__name__)
+                await asyncio.sleep(delay)
+            except Exception:
+                self._bump(failed=1)
+                raise
+
+    async def generate(self, prompt: str, system_instruction: Optional[str] = None,
+                       timeout: Optional[float] = None, on_text: Optional[Callable[[str, int], Any]] = None,
+                       **kwargs):
+        """Awaitable from any event loop; the call itself runs on the executor's loop."""
+        coro = self._generate(prompt, system_instruction, timeout, kwargs, on_text)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def submit(self, coro) -> "concurrent.futures.Future":
+        """Schedule a coroutine on the executor's loop from synchronous code."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        """Run a coroutine on the executor's loop from synchronous code and wait for it."""
+        return self.submit(coro).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._counts)
+        out["throttled_s"] = round(out["throttled_s"], 2)
+        return out
+
+
+_EXECUTOR: Optional[GeminiExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_executor() -> GeminiExecutor:
+    """Process-wide GeminiExecutor."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = GeminiExecutor()
+    return _EXECUTOR
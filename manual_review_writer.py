@@ -1,25 +1,100 @@
 import re
+import sqlite3
+import threading
 from pathlib import Path
 import json
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from metrics import span
+
+MANUAL_DIR = Path(__file__).resolve().parent / "manual_review_cases"
+REVIEW_DB = MANUAL_DIR / "review_queue.sqlite"
+
+PAGE_SIZE = 20
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS cases (
+      case_id INTEGER PRIMARY KEY AUTOINCREMENT,
+      created TEXT NOT NULL,          -- ISO timestamp, sorts chronologically
+      customer_id INTEGER,
+      customer_name TEXT,
+      name_lc TEXT,                   -- lower-cased name for case-insensitive search
+      overall_risk TEXT,
+      interest_rate TEXT,
+      recommendation TEXT,
+      source_file TEXT UNIQUE,        -- legacy JSON case file it was imported from
+      payload TEXT NOT NULL           -- full case JSON, only read when a case is opened
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_cases_created ON cases(created DESC, case_id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_cases_customer ON cases(customer_id, created DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_cases_risk ON cases(overall_risk, created DESC)",
+]
+
+_init_lock = threading.Lock()
+_initialised = False
 
 def _safe_slug(s: str) -> str:
     s = (s or "").strip().lower()
     s = re.sub(r"[^a-z0-9]+", "_", s)
     return s.strip("_") or "unknown"
 
-def write_manual_review_case(customer, result, evidence, rag_query):
-    out_dir = Path(__file__).resolve().parent / "manual_review_cases"
-    out_dir.mkdir(exist_ok=True)
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    global _initialised
+    MANUAL_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(REVIEW_DB, timeout=30)
+    try:
+        if not _initialised:
+            with _init_lock:
+                if not _initialised:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    for stmt in _SCHEMA:
+                        conn.execute(stmt)
+                    _import_legacy_files(conn)
+                    conn.commit()
+                    _initialised = True
+        with conn:
+            yield conn
+    finally:
+        conn.close()
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    name_slug = _safe_slug(customer.get("name"))
-    cid = customer.get("id", "unknown")
+def _row_values(ts: str, payload: Dict[str, Any]) -> Tuple:
+    customer = payload.get("customer") or {}
+    decision = payload.get("decision") or {}
+    name = customer.get("name")
+    return (
+        ts,
+        customer.get("id"),
+        name,
+        (name or "").lower(),
+        decision.get("overall_risk"),
+        decision.get("interest_rate"),
+        decision.get("recommendation"),
+    )
 
-    # filename format:
-    # manual_review_name_id_ts.json
-    filename = f"manual_review_{name_slug}_{cid}_{ts}.json"
-    path = out_dir / filename
+def _import_legacy_files(conn: sqlite3.Connection):
+    # One-off: cases written as manual_review_*.json files before the queue moved into SQLite
+    for p in sorted(MANUAL_DIR.glob("manual_review_*.json")):
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            data = {"error": "Failed to parse JSON", "path": str(p)}
+        try:
+            created = datetime.strptime(data.get("timestamp", ""), "%Y%m%d_%H%M%S").isoformat()
+        except ValueError:
+            created = datetime.fromtimestamp(p.stat().st_mtime).isoformat()
+        conn.execute(
+            "INSERT OR IGNORE INTO cases (created, customer_id, customer_name, name_lc, overall_risk, "
+            "interest_rate, recommendation, source_file, payload) VALUES (?,?,?,?,?,?,?,?,?)",
+            (*_row_values(created, data), p.name, json.dumps(data)),
+        )
+
+def write_manual_review_case(customer, result, evidence, rag_query) -> int:
+    """Add a case to the manual review queue; returns its case_id."""
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
 
     payload = {
         "timestamp": ts,
@@ -37,5 +112,80 @@ def write_manual_review_case(customer, result, evidence, rag_query):
         "evidence_used": result.get("evidence_used", []),
     }
 
-    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
-    return str(path)
+    with span("manual_review_write"), _connect() as conn:
+        cur = conn.execute(
+            "INSERT INTO cases (created, customer_id, customer_name, name_lc, overall_risk, "
+            "interest_rate, recommendation, payload) VALUES (?,?,?,?,?,?,?,?)",
+            (*_row_values(datetime.now().isoformat(timespec="microseconds"), payload), json.dumps(payload)),
+        )
+        return cur.lastrowid
+
+def case_file_name(case: Dict[str, Any]) -> str:
+    """Download name for a case, in the old manual_review_<name>_<id>_<ts>.json format."""
+    if case.get("source_file"):
+        return case["source_file"]
+    ts = (case.get("created") or "").replace("-", "").replace(":", "").replace("T", "_")[:15]
+    return f"manual_review_{_safe_slug(case.get('customer_name'))}_{case.get('customer_id', 'unknown')}_{ts}.json"
+
+def _filters(query: Optional[str], risk: Optional[str], date_from: Optional[str], date_to: Optional[str]):
+    where, params = [], []
+    q = (query or "").strip().lower()
+    if q:
+        # Substring of the ID or name, as the UI has always matched ("1000" finds 100000-100999)
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where.append("(CAST(customer_id AS TEXT) LIKE ? ESCAPE '\\' OR name_lc LIKE ? ESCAPE '\\')")
+        params += [like, like]
+    if risk:
+        where.append("overall_risk = ?")
+        params.append(risk)
+    if date_from:
+        where.append("created >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("created < ?")
+        params.append(date_to)
+    return where, params
+
+def count_cases(query: Optional[str] = None, risk: Optional[str] = None,
+                date_from: Optional[str] = None, date_to: Optional[str] = None) -> int:
+    where, params = _filters(query, risk, date_from, date_to)
+    sql = "SELECT COUNT(*) FROM cases" + (" WHERE " + " AND ".join(where) if where else "")
+    with _connect() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+def list_cases(
+    query: Optional[str] = None,
+    risk: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    after: Optional[Tuple[str, int]] = None,
+    limit: int = PAGE_SIZE,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """
+    One page of case summaries (newest first, no payload), filtered in
+    SQL by ID/name text, risk and created date range [date_from, date_to).
+    `after` is the keyset cursor returned with the previous page; the
+    returned cursor is None on the last page.
+    """
+    where, params = _filters(query, risk, date_from, date_to)
+    if after is not None:
+        where.append("(created < ? OR (created = ? AND case_id < ?))")
+        params += [after[0], after[0], after[1]]
+    sql = (
+        "SELECT case_id, created, customer_id, customer_name, overall_risk, interest_rate, recommendation, source_file "
+        "FROM cases" + (" WHERE " + " AND ".join(where) if where else "")
+        + " ORDER BY created DESC, case_id DESC LIMIT ?"
+    )
+    with _connect() as conn:
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    cols = ("case_id", "created", "customer_id", "customer_name", "overall_risk", "interest_rate",
+            "recommendation", "source_file")
+    cases = [dict(zip(cols, r)) for r in rows[:limit]]
+    cursor = (cases[-1]["created"], cases[-1]["case_id"]) if len(rows) > limit else None
+    return cases, cursor
+
+def get_case(case_id: int) -> Optional[Dict[str, Any]]:
+    """Full case payload (the JSON written by write_manual_review_case)."""
+    with _connect() as conn:
+        row = conn.execute("SELECT payload FROM cases WHERE case_id=?", (case_id,)).fetchone()
+    return json.loads(row[0]) if row else None
@@ -0,0 +1,268 @@
+"""
+In-process metrics for the assessment pipeline: timed spans per stage,
+counters and latency histograms, exported as Prometheus text or a JSON
+summary.
+
+  with span("db_lookup"):
+      ...
+  inc("cache_requests_total", cache="llm", result="hit")
+  observe("llm_tokens", 812, kind="prompt")
+
+Spans record into the "stage_seconds" histogram (labelled by stage) and
+count failures in "stage_errors_total". Everything is a dict update under
+one lock, cheap enough to leave on; METRICS_ENABLED=0 turns spans, counters
+and histograms into no-ops.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))               # serve /metrics on this port; 0 = off
+METRICS_SUMMARY_PATH = os.getenv("METRICS_SUMMARY_PATH", "")      # write a JSON summary here at exit
+
+# Histogram bucket upper bounds: seconds for latencies (50 us .. 120 s; audit
+# writes, cache lookups and the like take well under a millisecond)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# ... and token counts for LLM usage
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _key(name: str, labels: Labels) -> str:
+    return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram; quantiles are interpolated within buckets
+    (as Prometheus does), narrowed to the observed min and max.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lo = max(self.bounds[i - 1] if i else 0.0, self.min)
+                hi = min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by name + labels."""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = Histogram(buckets)
+            h.observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - t0, stage=stage, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition format (counters and histograms)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted(((k, (h.bounds, list(h.counts), h.count, h.sum)) for k, h in self._histograms.items()),
+                           key=lambda kv: kv[0])
+
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        for (name, labels), (bounds, counts, count, total) in hists:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cum = 0
+            for bound, n in zip(bounds, counts):
+                cum += n
+                lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {cum}")
+            lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{fmt(labels)} {total:g}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        JSON-friendly snapshot: counters, histogram count/mean/p50/p95/p99/max
+        (latencies in ms), and hit rates for every cache reported through
+        cache_requests_total.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            out_hists = {}
+            for (name, labels), h in sorted(self._histograms.items(), key=lambda kv: kv[0]):
+                scale = 1000.0 if name.endswith("_seconds") else 1.0
+                unit = "_ms" if scale != 1.0 else ""
+                out_hists[_key(name, labels)] = {
+                    "count": h.count,
+                    f"mean{unit}": round(scale * h.sum / h.count, 3) if h.count else 0.0,
+                    f"p50{unit}": round(scale * h.quantile(0.50), 3),
+                    f"p95{unit}": round(scale * h.quantile(0.95), 3),
+                    f"p99{unit}": round(scale * h.quantile(0.99), 3),
+                    f"max{unit}": round(scale * h.max, 3),
+                }
+
+        caches: Dict[str, Dict[str, float]] = {}
+        for (name, labels), v in counters.items():
+            if name == "cache_requests_total":
+                lab = dict(labels)
+                caches.setdefault(lab.get("cache", "?"), {"hit": 0, "miss": 0})[lab.get("result", "miss")] += v
+        for c in caches.values():
+            total = c["hit"] + c["miss"]
+            c["hit_rate"] = round(c["hit"] / total, 3) if total else 0.0
+
+        return {
+            "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "uptime_s": round(time.time() - self.started, 1),
+            "counters": {_key(n, l): v for (n, l), v in sorted(counters.items())},
+            "histograms": out_hists,
+            "cache_hit_rates": caches,
+        }
+
+    def write_summary(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+
+_REGISTRY = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    return _REGISTRY
+
+def span(stage: str, **labels):
+    """Time a pipeline stage: `with span("retrieve"): ...`"""
+    return _REGISTRY.span(stage, **labels)
+
+def inc(name: str, value: float = 1, **labels):
+    _REGISTRY.inc(name, value, **labels)
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    _REGISTRY.observe(name, value, buckets, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, ctype = _REGISTRY.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, ctype = json.dumps(_REGISTRY.summary()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep scrapes out of the app's stderr
+
+
+_SERVER: Optional[ThreadingHTTPServer] = None
+_SERVER_LOCK = threading.Lock()
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> Optional[int]:
+    """
+    Serve /metrics (Prometheus) and /metrics.json on a background thread,
+    once per process. Returns the bound port, or None if port is 0.
+    """
+    global _SERVER
+    if not port:
+        return None
+    if _SERVER is None:
+        with _SERVER_LOCK:
+            if _SERVER is None:
+                _SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+                _SERVER.daemon_threads = True
+                threading.Thread(target=_SERVER.serve_forever, name="metrics-http", daemon=True).start()
+    return _SERVER.server_address[1]
+
+
+if METRICS_SUMMARY_PATH:
+    atexit.register(lambda: _REGISTRY.write_summary(METRICS_SUMMARY_PATH))
@@ -1,63 +1,115 @@
 from io import BytesIO
-from typing import Optional
+from typing import Iterable, List, Optional, Tuple
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT
 
+from metrics import span
 
-def letter_text_to_pdf_bytes(
-    letter_text: str,
-    title: Optional[str] = None,
-) -> bytes:
-    """
-    Convert a plain-text letter into a simple PDF (A4).
-    Returns PDF bytes.
-    """
-    buffer = BytesIO()
+LETTER_PDF_TITLE = "Applicant Letter — Loan Application Outcome"
 
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        leftMargin=20 * mm,
-        rightMargin=20 * mm,
-        topMargin=18 * mm,
-        bottomMargin=18 * mm,
-        title=title or "Applicant Letter",
-    )
+# Built once per process and shared by every document
+_STYLES = getSampleStyleSheet()
+TITLE_STYLE = _STYLES["Title"]
+BODY_STYLE = ParagraphStyle(
+    "Body",
+    parent=_STYLES["Normal"],
+    fontName="Helvetica",
+    fontSize=11,
+    leading=14,
+    alignment=TA_LEFT,
+    spaceAfter=8,
+)
 
-    styles = getSampleStyleSheet()
-    body = ParagraphStyle(
-        "Body",
-        parent=styles["Normal"],
-        fontName="Helvetica",
-        fontSize=11,
-        leading=14,
-        alignment=TA_LEFT,
-        spaceAfter=8,
+PAGE_LAYOUT = dict(
+    pagesize=A4,
+    leftMargin=20 * mm,
+    rightMargin=20 * mm,
+    topMargin=18 * mm,
+    bottomMargin=18 * mm,
+)
+
+
+class _Bookmark(Flowable):
+    """Zero-size flowable that adds a PDF outline entry pointing at the current page."""
+
+    def __init__(self, key: str, title: str):
+        super().__init__()
+        self.key, self.title = key, title
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("&", "&amp;")
+            .replace("<", "&lt;")
+            .replace(">", "&gt;")
+            .replace("\n", "<br/>")
     )
 
+
+def _letter_story(letter_text: str, title: Optional[str]) -> List[Flowable]:
     story = []
 
     if title:
-        story.append(Paragraph(f"<b>{title}</b>", styles["Title"]))
+        story.append(Paragraph(f"<b>{_escape(title)}</b>", TITLE_STYLE))
         story.append(Spacer(1, 8))
 
     # Preserve paragraphs
     paragraphs = [p.strip() for p in letter_text.split("\n\n") if p.strip()]
     for p in paragraphs:
-        safe = (
-            p.replace("&", "&amp;")
-             .replace("<", "&lt;")
-             .replace(">", "&gt;")
-             .replace("\n", "<br/>")
-        )
-        story.append(Paragraph(safe, body))
+        story.append(Paragraph(_escape(p), BODY_STYLE))
         story.append(Spacer(1, 6))
+    return story
 
-    doc.build(story)
+
+def letter_text_to_pdf_bytes(
+    letter_text: str,
+    title: Optional[str] = None,
+) -> bytes:
+    """
+    Convert a plain-text letter into a simple PDF (A4).
+    Returns PDF bytes.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, title=title or "Applicant Letter", **PAGE_LAYOUT)
+    with span("pdf_render"):
+        doc.build(_letter_story(letter_text, title))
+    pdf_bytes = buffer.getvalue()
+    buffer.close()
+    return pdf_bytes
+
+
+def letters_to_pdf_bytes(
+    letters: Iterable[Tuple[str, str]],
+    title: Optional[str] = None,
+    doc_title: str = "Applicant Letters",
+) -> bytes:
+    """
+    Render many letters into one PDF: each (bookmark, letter_text) starts
+    on a new page under its own outline entry. `title` is printed at the
+    top of every letter. Returns PDF bytes.
+    """
+    story: List[Flowable] = []
+    for i, (bookmark, letter_text) in enumerate(letters):
+        if i:
+            story.append(PageBreak())
+        story.append(_Bookmark(f"letter{i}", bookmark))
+        story.extend(_letter_story(letter_text, title))
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, title=doc_title, **PAGE_LAYOUT)
+    with span("pdf_render", kind="merged"):
+        doc.build(story)
     pdf_bytes = buffer.getvalue()
     buffer.close()
     return pdf_bytes
@@ -0,0 +1,121 @@
+import re
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+PAGE_BREAK = "\f"
+
+# (normalised line, page number, char_start, char_end)
+Line = Tuple[str, int, int, int]
+
+
+def iter_cached_pages(path: Path) -> Iterator[str]:
+    """
+    Stream pages back out of a text cache file, one page in memory at a
+    time. Pages are separated by a line holding only a form feed.
+    """
+    buf: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.rstrip("\n") == PAGE_BREAK:
+                yield "".join(buf)[:-1]
+                buf = []
+            else:
+                buf.append(line)
+    yield "".join(buf)
+
+
+def write_pages(pages: Iterable[str], f) -> int:
+    """Write pages to an open text file in the cache format; returns page count."""
+    n = 0
+    for page in pages:
+        if n:
+            f.write("\n" + PAGE_BREAK + "\n")
+        f.write(page.replace(PAGE_BREAK, "\n"))
+        n += 1
+    return n
+
+
+def iter_lines(pages: Iterable[str]) -> Iterator[Line]:
+    """
+    Pages -> non-empty normalised lines. Offsets are into the document's
+    extracted text (pages joined by newlines, line endings normalised).
+    """
+    doc_pos = 0
+    for page_no, page in enumerate(pages, start=1):
+        page = page.replace("\r\n", "\n").replace("\r", "\n")
+        pos = doc_pos
+        for raw in page.split("\n"):
+            ln = re.sub(r"\s+", " ", raw).strip()
+            if ln:
+                yield ln, page_no, pos, pos + len(raw)
+            pos += len(raw) + 1
+        doc_pos += len(page) + 1
+
+
+def iter_chunks(lines: Iterable[Line], max_chars: int = 900, overlap_lines: int = 2) -> Iterator[Dict[str, Any]]:
+    """
+    Lines -> chunks of up to max_chars, keeping table rows together and
+    repeating the last `overlap_lines` lines of each chunk at the start of
+    the next. Only the current chunk's lines are held in memory.
+    Each chunk records its page range and character span.
+    """
+    buf: deque = deque()
+    buf_len = 0
+    last_flushed: List[Line] = []
+
+    def make(items) -> Dict[str, Any]:
+        return {
+            "text": "\n".join(x[0] for x in items).strip(),
+            "page_start": items[0][1],
+            "page_end": items[-1][1],
+            "char_start": items[0][2],
+            "char_end": items[-1][3],
+        }
+
+    for line in lines:
+        ln, page_no, start, end = line
+        ln_len = len(ln) + 1
+
+        # If a single line is huge, split it safely
+        if ln_len > max_chars:
+            if buf:
+                yield make(buf)
+                buf.clear()
+                buf_len = 0
+            for j in range(0, len(ln), max_chars):
+                yield {"text": ln[j:j + max_chars], "page_start": page_no, "page_end": page_no,
+                       "char_start": start, "char_end": end}
+            last_flushed = []
+            continue
+
+        if buf_len + ln_len > max_chars:
+            fresh = len(buf) - len(last_flushed) if last_flushed else len(buf)
+            if fresh > 0:
+                chunk_lines = list(buf)
+                yield make(chunk_lines)
+                # Overlap a couple of lines from the chunk just emitted
+                keep = chunk_lines[-overlap_lines:] if overlap_lines > 0 else []
+                last_flushed = keep
+                buf = deque(keep)
+                buf_len = sum(len(x[0]) + 1 for x in buf)
+            # Never emit an overlap-only chunk: shed overlap until the line fits
+            while buf and buf_len + ln_len > max_chars:
+                buf_len -= len(buf.popleft()[0]) + 1
+                last_flushed = list(buf)
+
+        buf.append(line)
+        buf_len += ln_len
+
+    if len(buf) > len(last_flushed):
+        yield make(list(buf))
+
+
+def batched(items: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
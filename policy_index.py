@@ -0,0 +1,141 @@
+import os
+from typing import Optional
+
+import numpy as np
+import faiss
+
+# Which FAISS index to build for the policy store:
+# - flat     : exact brute-force inner product (default, fine for small corpora)
+# - hnsw     : graph index, fast and high recall, more memory
+# - ivf_flat : inverted lists over k-means cells, exact vectors
+# - ivf_pq   : inverted lists + product quantization, smallest memory
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+INDEX_TYPE = os.getenv("POLICY_INDEX_TYPE", "flat").lower()
+
+# Build-time knobs
+HNSW_M = int(os.getenv("POLICY_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("POLICY_HNSW_EF_CONSTRUCTION", "200"))
+IVF_NLIST = int(os.getenv("POLICY_IVF_NLIST", "0"))  # 0 = pick from corpus size
+# Incremental syncs add to the cells the IVF quantizer was trained with; once
+# the index holds this many times its training set, it is re-trained from scratch
+IVF_RETRAIN_GROWTH = float(os.getenv("POLICY_IVF_RETRAIN_GROWTH", "4"))
+PQ_M = int(os.getenv("POLICY_PQ_M", "48"))  # sub-quantizers; must divide the embedding dim
+PQ_NBITS = int(os.getenv("POLICY_PQ_NBITS", "8"))
+
+# Query-time knobs (can be overridden per search call)
+DEFAULT_NPROBE = int(os.getenv("POLICY_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("POLICY_EF_SEARCH", "64"))
+
+
+def _pick_nlist(n: int) -> int:
+    # ~4*sqrt(n) cells, and at least ~39 training points per cell
+    nlist = IVF_NLIST or int(4 * np.sqrt(n))
+    return max(1, min(nlist, n // 39))
+
+
+def make_index(index_type: str, dim: int, train_vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    Build an empty, trained index of the requested type that accepts
+    add_with_ids(). IVF types are trained on `train_vectors`; if there
+    are too few vectors to train them, a flat index is returned instead.
+
+    Flat and HNSW are wrapped in IndexIDMap2. IVF indexes are not: their
+    inverted lists store the caller's IDs, so add_with_ids() and
+    remove_ids() work on them directly, while IndexIDMap2.remove_ids()
+    assumes the inner index renumbers what is left (flat does, IVF
+    doesn't) and would corrupt the ID map.
+    """
+    index_type = (index_type or "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    n = 0 if train_vectors is None else len(train_vectors)
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    if index_type == "ivf_flat" and n >= 39:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, _pick_nlist(n), faiss.METRIC_INNER_PRODUCT)
+        index.train(train_vectors)
+        return index
+
+    if index_type == "ivf_pq" and n >= 39 * (1 << PQ_NBITS) and dim % PQ_M == 0:
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, _pick_nlist(n), PQ_M, PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(train_vectors)
+        return index
+
+    # flat, or an IVF type without enough data to train yet
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """Unwrap an ID map to the index that actually does the search."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def is_ivf(index: faiss.Index) -> bool:
+    return index_kind(index) in ("ivf_flat", "ivf_pq")
+
+
+def ivf_outgrown(index: faiss.Index, trained_on: int) -> bool:
+    """True once an IVF index holds IVF_RETRAIN_GROWTH times the vectors its cells were trained on."""
+    return is_ivf(index) and trained_on > 0 and index.ntotal > IVF_RETRAIN_GROWTH * trained_on
+
+
+def describe_index(index: faiss.Index) -> str:
+    kind = index_kind(index)
+    if is_ivf(index):
+        return f"{kind}, nlist {faiss.extract_index_ivf(index).nlist}"
+    return kind
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    # HNSW graphs cannot drop nodes; those are rebuilt instead
+    return index_kind(index) != "hnsw"
+
+
+def search_params(
+    index: faiss.Index,
+    sel: Optional[faiss.IDSelector] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> Optional[faiss.SearchParameters]:
+    """SearchParameters matching the index type, with optional ID selector."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or DEFAULT_EF_SEARCH
+    elif kind in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or DEFAULT_NPROBE
+    elif sel is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+def vectors_and_ids(index: faiss.Index):
+    """(vectors, ids) currently stored in an ID-mapped index."""
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    vecs = base_index(index).reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype="float32")
+    return np.asarray(vecs, dtype="float32"), ids
@@ -0,0 +1,138 @@
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from pypdf import PdfReader
+
+from policy_chunker import PAGE_BREAK, batched, write_pages
+
+# Parallel ingestion knobs (1 = serial, the default for the app process)
+INGEST_WORKERS = int(os.getenv("POLICY_INGEST_WORKERS", "1"))
+EMBED_WORKERS = int(os.getenv("POLICY_EMBED_WORKERS", "1"))
+EMBED_THREADS = int(os.getenv("POLICY_EMBED_THREADS", "0"))  # compute threads per embed worker; 0 = library default
+
+EMBED_BATCH_SIZE = 64
+PAGES_PER_TASK = 16     # large PDFs are split into page ranges across workers
+MIN_SHARD = 512         # don't start embed workers for fewer chunks than this each
+
+
+def iter_pages(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    """Stream the text of pages [start, end) of a policy file (.txt files are one page)."""
+    p = Path(path)
+    if p.suffix.lower() != ".pdf":
+        yield p.read_text(encoding="utf-8", errors="ignore")
+        return
+    reader = PdfReader(str(p))
+    for page in reader.pages[start:end]:
+        yield page.extract_text() or ""
+
+
+def read_pages(path: str, start: int = 0, end: Optional[int] = None) -> List[str]:
+    return list(iter_pages(path, start, end))
+
+
+def _page_count(path: str) -> int:
+    if Path(path).suffix.lower() != ".pdf":
+        return 1
+    return len(PdfReader(path).pages)
+
+
+def _read_task(task: Tuple[str, int, Optional[int]]) -> List[str]:
+    return read_pages(*task)
+
+
+def extract_to_files(jobs: List[Tuple[str, str]], workers: int = INGEST_WORKERS):
+    """
+    Extract each (source, dest) job into a page-separated text file.
+    Serially, pages are streamed straight to disk one at a time. With
+    workers > 1 the pages of every file are spread over a process pool in
+    PAGES_PER_TASK ranges and appended to their file in page order.
+    """
+    if workers <= 1 or not jobs:
+        for src, dest in jobs:
+            with open(dest, "w", encoding="utf-8") as f:
+                write_pages(iter_pages(src), f)
+        return
+
+    paths = [src for src, _ in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        counts = list(ex.map(_page_count, paths))
+        tasks, owners = [], []
+        for i, (path, n) in enumerate(zip(paths, counts)):
+            if Path(path).suffix.lower() != ".pdf":
+                tasks.append((path, 0, None))
+                owners.append(i)
+                continue
+            for start in range(0, max(n, 1), PAGES_PER_TASK):
+                tasks.append((path, start, min(start + PAGES_PER_TASK, n)))
+                owners.append(i)
+
+        # map() yields in submission order, so page order is preserved
+        current, f, written = None, None, 0
+        try:
+            for owner, pages in zip(owners, ex.map(_read_task, tasks)):
+                if owner != current:
+                    if f:
+                        f.close()
+                    current, written = owner, 0
+                    f = open(jobs[owner][1], "w", encoding="utf-8")
+                if written:
+                    f.write("\n" + PAGE_BREAK + "\n")
+                written += write_pages(pages, f)
+        finally:
+            if f:
+                f.close()
+
+
+_WORKER_MODEL = None
+
+def _init_embed_worker(model_name: str, backend: str, threads: int):
+    global _WORKER_MODEL
+    from embedding_backends import load_embedder
+
+    _WORKER_MODEL = load_embedder(model_name, backend, threads=threads)
+
+
+def _embed_shard(texts: List[str]) -> np.ndarray:
+    embs = _WORKER_MODEL.encode(texts, normalize_embeddings=True, batch_size=EMBED_BATCH_SIZE, show_progress_bar=False)
+    return np.asarray(embs, dtype="float32")
+
+
+def embed_texts(
+    embedder,
+    texts: List[str],
+    model_name: str,
+    backend: str = "torch",
+    workers: int = EMBED_WORKERS,
+    threads: int = EMBED_THREADS,
+) -> np.ndarray:
+    """
+    Normalized float32 embeddings for `texts`, in order. With workers > 1
+    and enough texts, contiguous shards are embedded by separate processes
+    (each loading its own `backend` model with `threads` compute threads)
+    and concatenated.
+    """
+    if not texts:
+        return np.empty((0, embedder.get_sentence_embedding_dimension()), dtype="float32")
+    workers = min(workers, len(texts) // MIN_SHARD)
+    if workers <= 1:
+        # Encode in bounded slices straight into the output matrix
+        out = np.empty((len(texts), embedder.get_sentence_embedding_dimension()), dtype="float32")
+        pos = 0
+        for batch in batched(texts, EMBED_BATCH_SIZE * 16):
+            embs = embedder.encode(batch, normalize_embeddings=True, batch_size=EMBED_BATCH_SIZE, show_progress_bar=False)
+            out[pos:pos + len(batch)] = embs
+            pos += len(batch)
+        return out
+
+    bounds = np.linspace(0, len(texts), workers + 1).astype(int)
+    shards = [texts[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    # spawn: forked children of a process that already ran torch can deadlock
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_embed_worker, initargs=(model_name, backend, threads)) as ex:
+        parts = list(ex.map(_embed_shard, shards))
+    return np.concatenate(parts)
@@ -1,32 +1,49 @@
 import os
+import hashlib
+import json
+import threading
+import time
+import uuid
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 
 import numpy as np
 import faiss
-from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer
 import re
+
+from bm25_index import BM25Index
+from chunk_store import ChunkMetaStore
+from embedding_backends import EMBED_BACKEND, Embedder, load_embedder, backend_model_id
+from metrics import inc, span
+from policy_ingest import INGEST_WORKERS, EMBED_WORKERS, EMBED_THREADS, extract_to_files, embed_texts
+from policy_chunker import iter_cached_pages, iter_lines, iter_chunks
+from policy_rules import PolicyRules
+from policy_index import (INDEX_TYPE, make_index, index_kind, is_ivf, ivf_outgrown, describe_index, supports_remove,
+                          search_params, vectors_and_ids)
 from typing import List
 
 POLICY_DIR = Path("policies")
 STORE_DIR = Path("vector_store")
 INDEX_PATH = STORE_DIR / "policy.index"
-META_PATH = STORE_DIR / "policy_meta.npy"
+META_PATH = STORE_DIR / "policy_meta.npy"  # legacy pickled metadata, removed on rebuild
+META_BASE = STORE_DIR / "policy_meta"  # columnar store: policy_meta.{cols.npy,text.bin,sources.json}
+BM25_PATH = STORE_DIR / "policy_bm25.npz"
+RULES_PATH = STORE_DIR / "policy_rules.json"  # band/rate tables compiled from the chunks
+MANIFEST_PATH = STORE_DIR / "manifest.json"
+CACHE_DIR = STORE_DIR / "cache"
+TEXT_CACHE_DIR = CACHE_DIR / "text"
+EMB_CACHE_DIR = CACHE_DIR / "emb"
 
 # Small, good-enough embedding model; CPU-friendly
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Backend (torch / onnx / onnx-int8) is chosen with POLICY_EMBED_BACKEND
+EMBED_MODEL_ID = backend_model_id(EMBED_MODEL_NAME, EMBED_BACKEND)
 
-def _read_pdf_text(pdf_path: Path) -> str:
-    reader = PdfReader(str(pdf_path))
-    parts = []
-    for page in reader.pages:
-        txt = page.extract_text() or ""
-        parts.append(txt)
-    return "\n".join(parts)
-
-def _read_txt_text(txt_path: Path) -> str:
-    return txt_path.read_text(encoding="utf-8", errors="ignore")
+# Hybrid retrieval: fuse dense (FAISS) and lexical (BM25) rankings with
+# reciprocal-rank fusion. Each side contributes its top HYBRID_CANDIDATES.
+HYBRID = os.getenv("POLICY_HYBRID", "1") not in ("0", "false", "no")
+RRF_K = 60
+HYBRID_CANDIDATES = 20
 
 def _chunk_text(text: str, max_chars: int = 900, overlap_lines: int = 2) -> List[str]:
     """
@@ -34,122 +51,591 @@ def _chunk_text(text: str, max_chars: int = 900, overlap_lines: int = 2) -> List
     - Keeps newlines
     - Packs multiple lines into a chunk up to max_chars
     - Adds small overlap in lines to avoid cutting boundaries
+    See policy_chunker for the streaming, page-aware version used at index time.
+    """
+    return [c["text"] for c in iter_chunks(iter_lines([text]), max_chars, overlap_lines)]
+
+_EMBEDDER: Optional[Embedder] = None
+_EMBEDDER_LOCK = threading.Lock()
+
+def get_embedder() -> Embedder:
+    """Load the embedding model once per process and reuse it."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None:
+                _EMBEDDER = load_embedder(EMBED_MODEL_NAME, EMBED_BACKEND)
+    return _EMBEDDER
+
+def _policy_files() -> List[Path]:
+    return [p for p in sorted(POLICY_DIR.glob("*")) if p.suffix.lower() in (".pdf", ".txt")]
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _text_sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _atomic_write(path: Path, write_fn):
+    # Write to a temp file next to the target, then rename over it
+    tmp = path.with_name(path.name + ".tmp")
+    write_fn(tmp)
+    os.replace(tmp, path)
+
+def _write_npz(path: Path, **arrays):
+    # Pass a handle so numpy doesn't append its own suffix to the temp name
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+def _write_npy(path: Path, arr: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, arr)
+
+def _write_manifest(manifest: Dict[str, Any]):
+    _atomic_write(MANIFEST_PATH, lambda t: t.write_text(json.dumps(manifest, indent=2), encoding="utf-8"))
+
+def _text_cache_path(sha: str) -> Path:
+    return TEXT_CACHE_DIR / f"{sha}.pages.txt"
+
+def _ensure_text_cache(jobs: List[Tuple[Path, str]], workers: int) -> List[Path]:
+    """
+    Page-separated text cache file for each (path, sha) job, keyed by file
+    content hash. Uncached files are extracted together, across a process
+    pool if workers > 1.
+    """
+    todo = [(str(path), _text_cache_path(sha)) for path, sha in jobs if not _text_cache_path(sha).exists()]
+    if todo:
+        TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_jobs = [(src, str(dest.with_name(dest.name + ".tmp"))) for src, dest in todo]
+        extract_to_files(tmp_jobs, workers=workers)
+        for (_, tmp), (_, dest) in zip(tmp_jobs, todo):
+            os.replace(tmp, dest)
+    return [_text_cache_path(sha) for _, sha in jobs]
+
+def _emb_cache_path(sha: str) -> Path:
+    model_slug = re.sub(r"[^a-zA-Z0-9]+", "_", EMBED_MODEL_ID)
+    return EMB_CACHE_DIR / model_slug / f"{sha}.npz"
+
+def _load_emb_cache(sha: str) -> Dict[str, np.ndarray]:
+    """chunk text hash -> embedding for one cached file version."""
+    path = _emb_cache_path(sha)
+    if not path.exists():
+        return {}
+    data = np.load(str(path))
+    return {str(h): v for h, v in zip(data["hashes"], data["embs"])}
+
+def _save_emb_cache(sha: str, hashes: List[str], embs: np.ndarray):
+    path = _emb_cache_path(sha)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write(path, lambda t: _write_npz(t, hashes=np.array(hashes), embs=embs))
+
+def _drop_file_cache(sha: str):
+    _text_cache_path(sha).unlink(missing_ok=True)
+    _emb_cache_path(sha).unlink(missing_ok=True)
+
+def _empty_manifest() -> Dict[str, Any]:
+    # build_id changes on every from-scratch build (downstream caches key on it)
+    return {"model": EMBED_MODEL_ID, "index_type": INDEX_TYPE, "build_id": uuid.uuid4().hex,
+            "next_id": 0, "files": {}}
+
+def _apply_changes(
+    index: Optional[faiss.Index],
+    dim: int,
+    remove_ids: List[int],
+    add_vecs: List[np.ndarray],
+    add_ids: List[int],
+) -> faiss.Index:
     """
-    # Normalize line endings and strip weird spacing, but KEEP newlines
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-
-    # Clean up excessive blank lines
-    lines = [re.sub(r"\s+", " ", ln).strip() for ln in text.split("\n")]
-    lines = [ln for ln in lines if ln]  # drop empty
-
-    chunks = []
-    buf = []
-    buf_len = 0
-
-    def flush():
-        nonlocal buf, buf_len
-        if buf:
-            chunks.append("\n".join(buf).strip())
-            buf = []
-            buf_len = 0
-
-    i = 0
-    while i < len(lines):
-        ln = lines[i]
-        ln_len = len(ln) + 1
-
-        # If a single line is huge, split it safely
-        if ln_len > max_chars:
-            flush()
-            for j in range(0, len(ln), max_chars):
-                chunks.append(ln[j:j+max_chars])
-            i += 1
+    Remove/add vectors by stable ID. A new index of INDEX_TYPE is built
+    (and trained) when there is none yet, when the index cannot remove
+    vectors (HNSW), or when a flat fallback can now be upgraded.
+    """
+    new_vecs = np.concatenate(add_vecs).astype("float32") if add_vecs else np.empty((0, dim), dtype="float32")
+    new_ids = np.array(add_ids, dtype="int64")
+
+    rebuild = index is None
+    if index is not None and isinstance(index, faiss.IndexIDMap2):
+        rebuild = (remove_ids and not supports_remove(index)) or (index_kind(index) != INDEX_TYPE and len(new_ids) > 0)
+    if rebuild:
+        if index is not None:
+            old_vecs, old_ids = vectors_and_ids(index)
+            keep = ~np.isin(old_ids, np.array(remove_ids, dtype="int64"))
+            new_vecs = np.concatenate([old_vecs[keep], new_vecs])
+            new_ids = np.concatenate([old_ids[keep], new_ids])
+        index = make_index(INDEX_TYPE, dim, new_vecs)
+    elif remove_ids:
+        index.remove_ids(np.array(remove_ids, dtype="int64"))
+
+    if len(new_ids):
+        index.add_with_ids(new_vecs, new_ids)
+    return index
+
+def _load_store() -> Optional[Tuple[faiss.Index, ChunkMetaStore, BM25Index, Dict[str, Any]]]:
+    if not (INDEX_PATH.exists() and MANIFEST_PATH.exists()):
+        return None
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    if manifest.get("model") != EMBED_MODEL_ID or manifest.get("index_type") != INDEX_TYPE:
+        # Different embedder or index type configured: re-index from the caches
+        return None
+    meta = ChunkMetaStore.open(META_BASE)
+    if meta is None:
+        return None
+    index = faiss.read_index(str(INDEX_PATH))
+    if index.ntotal != len(meta) or manifest.get("ntotal") != len(meta):
+        # Interrupted write: files disagree, re-index from the caches
+        return None
+    if "build_id" not in manifest:
+        manifest["build_id"] = uuid.uuid4().hex
+        _write_manifest(manifest)
+    bm25 = BM25Index.open(BM25_PATH)
+    if bm25 is None or len(bm25) != len(meta):
+        bm25 = BM25Index.from_docs((m["id"], m["text"]) for m in meta)
+    return index, meta, bm25, manifest
+
+def _save_store(index: faiss.Index, meta: ChunkMetaStore, bm25: BM25Index, manifest: Dict[str, Any]):
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+    _atomic_write(INDEX_PATH, lambda t: faiss.write_index(index, str(t)))
+    meta.save(META_BASE)
+    bm25.save(BM25_PATH)
+    PolicyRules.from_chunks(meta).save(RULES_PATH)
+    # Manifest last: it is the commit point for the index + meta pair
+    manifest["ntotal"] = len(meta)
+    _write_manifest(manifest)
+
+def sync_index(
+    embedder: Embedder,
+    index: Optional[faiss.Index],
+    meta: ChunkMetaStore,
+    bm25: BM25Index,
+    manifest: Dict[str, Any],
+    workers: int = INGEST_WORKERS,
+    embed_workers: int = EMBED_WORKERS,
+    embed_threads: int = EMBED_THREADS,
+) -> Tuple[faiss.Index, ChunkMetaStore, BM25Index, Dict[str, Any], Dict[str, List[str]]]:
+    """
+    Bring the index in line with ./policies using per-file content hashes.
+    Only added/changed files are extracted and embedded; removed/changed
+    files have their vectors removed by ID. Mutates `index`/`manifest` and
+    returns them with the updated metadata store, the BM25 index over the
+    same chunk IDs and a change summary.
+
+    Extraction of all changed files runs across `workers` processes and
+    the chunks still missing an embedding are encoded in one pass, sharded
+    over `embed_workers` processes. Vector IDs are assigned in file order
+    afterwards, so a parallel build matches a serial one.
+
+    An IVF index that has grown past IVF_RETRAIN_GROWTH times the vectors
+    it was trained on (manifest "ivf_trained_on") is re-indexed from the
+    text/embedding caches, which re-trains its cells on the whole corpus.
+    """
+    dim = embedder.get_sentence_embedding_dimension()
+    if index is not None and is_ivf(index):
+        # Manifests written before this was recorded: count from the current size
+        manifest.setdefault("ivf_trained_on", index.ntotal)
+    remove_ids: List[int] = []
+    new_rows: List[Dict[str, Any]] = []
+
+    summary = {"added": [], "updated": [], "removed": [], "unchanged": [], "touched": []}
+    files = manifest["files"]
+    present = {p.name: p for p in _policy_files()}
+
+    for name in sorted(set(files) - set(present)):
+        entry = files.pop(name)
+        remove_ids.extend(entry["ids"])
+        _drop_file_cache(entry["sha256"])
+        summary["removed"].append(name)
+
+    # 1) Work out which files actually changed
+    changed = []  # (name, path, stat, sha, old entry)
+    for name, path in present.items():
+        st = path.stat()
+        entry = files.get(name)
+        # Cheap check first; only rehash when size/mtime moved
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            summary["unchanged"].append(name)
             continue
+        sha = _file_sha256(path)
+        if entry and entry["sha256"] == sha:
+            # Same content, new mtime (e.g. re-uploaded): just refresh the manifest
+            entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+            summary["unchanged"].append(name)
+            summary["touched"].append(name)
+            continue
+        changed.append((name, path, st, sha, entry))
+
+    # 2) Extract (cached by content hash) and stream pages -> lines -> chunks
+    cache_files = _ensure_text_cache([(path, sha) for _, path, _, sha, _ in changed], workers)
+    per_file = []  # (chunks, hashes, reuse)
+    to_embed: Dict[str, str] = {}  # chunk hash -> text, deduplicated across files
+    for (name, path, st, sha, entry), cache_file in zip(changed, cache_files):
+        reuse = _load_emb_cache(sha)
+        if entry:
+            reuse = {**_load_emb_cache(entry["sha256"]), **reuse}
+            remove_ids.extend(entry["ids"])
+            _drop_file_cache(entry["sha256"])
+        chunks = list(iter_chunks(iter_lines(iter_cached_pages(cache_file))))
+        hashes = [_text_sha(ch["text"]) for ch in chunks]
+        for h, ch in zip(hashes, chunks):
+            inc("cache_requests_total", cache="chunk_embedding", result="hit" if h in reuse else "miss")
+            if h not in reuse:
+                to_embed.setdefault(h, ch["text"])
+        per_file.append((chunks, hashes, reuse))
 
-        if buf_len + ln_len <= max_chars:
-            buf.append(ln)
-            buf_len += ln_len
-            i += 1
-        else:
-            flush()
-            # Overlap a couple of lines from previous chunk
-            if overlap_lines > 0 and chunks:
-                prev_lines = chunks[-1].split("\n")[-overlap_lines:]
-                buf = prev_lines.copy()
-                buf_len = sum(len(x)+1 for x in buf)
-
-    flush()
-    return chunks
-
-def build_or_load_index() -> Tuple[faiss.IndexFlatIP, List[Dict[str, Any]], SentenceTransformer]:
+    # 3) Embed every missing chunk in one (optionally sharded) pass
+    fresh: Dict[str, np.ndarray] = {}
+    if to_embed:
+        with span("embed_chunks"):
+            embs = embed_texts(embedder, list(to_embed.values()), EMBED_MODEL_NAME, EMBED_BACKEND,
+                               workers=embed_workers, threads=embed_threads)
+        fresh = dict(zip(to_embed.keys(), embs))
+
+    # 4) Assign stable IDs in file order and cache per-file embeddings
+    add_vecs: List[np.ndarray] = []
+    add_ids: List[int] = []
+    for (name, path, st, sha, entry), (chunks, hashes, reuse) in zip(changed, per_file):
+        ids = list(range(manifest["next_id"], manifest["next_id"] + len(chunks)))
+        manifest["next_id"] += len(chunks)
+        if chunks:
+            vecs = np.stack([reuse[h] if h in reuse else fresh[h] for h in hashes]).astype("float32")
+            _save_emb_cache(sha, hashes, vecs)
+            add_vecs.append(vecs)
+            add_ids.extend(ids)
+        for vid, (idx, ch) in zip(ids, enumerate(chunks)):
+            new_rows.append({"id": vid, "source": name, "chunk_no": idx, **ch})
+
+        files[name] = {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "ids": ids}
+        summary["updated" if entry else "added"].append(name)
+
+    if index is None or remove_ids or add_ids:
+        before = index
+        index = _apply_changes(index, dim, remove_ids, add_vecs, add_ids)
+        if index is not before:
+            # Built from scratch: an IVF index was trained on exactly what it holds
+            manifest["ivf_trained_on"] = index.ntotal if is_ivf(index) else 0
+    if remove_ids or new_rows:
+        meta = meta.updated(remove_ids, new_rows)
+        bm25 = bm25.updated(remove_ids, [(r["id"], r["text"]) for r in new_rows])
+
+    if ivf_outgrown(index, manifest.get("ivf_trained_on", 0)):
+        # Vectors come from the caches, exact even for ivf_pq; IDs and build_id start afresh
+        inc("policy_index_retrains_total", index_type=index_kind(index))
+        fresh = _empty_manifest()
+        index, meta, bm25, fresh, _ = sync_index(
+            embedder, None, ChunkMetaStore.empty(), BM25Index.empty(), fresh, workers, embed_workers, embed_threads,
+        )
+        manifest.clear()
+        manifest.update(fresh)
+    return index, meta, bm25, manifest, summary
+
+def _persist_sync(index, meta, bm25, manifest, summary, force: bool = False) -> ChunkMetaStore:
+    """Save what changed; returns the metadata store re-opened memory-mapped."""
+    if force or summary["added"] or summary["updated"] or summary["removed"]:
+        _save_store(index, meta, bm25, manifest)
+        return ChunkMetaStore.open(META_BASE)
+    if summary["touched"]:
+        _write_manifest(manifest)
+    return meta
+
+def build_or_load_index(
+    embedder: Optional[Embedder] = None,
+    **ingest,
+) -> Tuple[faiss.Index, ChunkMetaStore, Embedder, BM25Index]:
+    """
+    Load the policy index (FAISS + chunk metadata + BM25), applying any
+    policy file changes first.
+    `ingest` is passed to sync_index (workers, embed_workers, embed_threads).
+    """
     STORE_DIR.mkdir(parents=True, exist_ok=True)
-    embedder = SentenceTransformer(EMBED_MODEL_NAME)
-
-    if INDEX_PATH.exists() and META_PATH.exists():
-        index = faiss.read_index(str(INDEX_PATH))
-        meta = np.load(str(META_PATH), allow_pickle=True).tolist()
-        return index, meta, embedder
-
-    # Ingest PDFs/TXTs
-    docs = []
-    for p in sorted(POLICY_DIR.glob("*")):
-        if p.suffix.lower() == ".pdf":
-            docs.append((p.name, _read_pdf_text(p)))
-        elif p.suffix.lower() == ".txt":
-            docs.append((p.name, _read_txt_text(p)))
-
-    if not docs:
+    if embedder is None:
+        embedder = get_embedder()
+
+    stored = _load_store()
+    if stored is None:
+        index, meta, bm25, manifest = None, ChunkMetaStore.empty(), BM25Index.empty(), _empty_manifest()
+    else:
+        index, meta, bm25, manifest = stored
+
+    index, meta, bm25, manifest, summary = sync_index(embedder, index, meta, bm25, manifest, **ingest)
+    meta = _persist_sync(index, meta, bm25, manifest, summary, force=stored is None)
+
+    if not len(meta):
         raise RuntimeError("No policy files found in ./policies (add sample_policy.txt or PDFs).")
 
-    chunks_meta = []
-    chunks = []
-    for filename, text in docs:
-        for idx, ch in enumerate(_chunk_text(text)):
-            chunks.append(ch)
-            chunks_meta.append({"source": filename, "chunk_id": f"{filename}::chunk{idx}", "text": ch})
+    return index, meta, embedder, bm25
+
+
+class PolicyRetriever:
+    """
+    Long-lived retrieval service shared by every Streamlit session.
+    - Loads the embedder, FAISS index and chunk metadata once per process
+    - Searches run concurrently against an immutable snapshot of the index
+    - rebuild()/reload() swap in a new snapshot under the lock
+    - Keeps load-time and per-query latency counters (see stats())
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._snapshot: Optional[Tuple[Any, ChunkMetaStore, Embedder, BM25Index]] = None
+        # (meta the grouping was built from, source -> vector IDs)
+        self._source_ids: Tuple[Any, Dict[str, np.ndarray]] = (None, {})
+        # (meta the rule table was compiled from, rules)
+        self._rules: Tuple[Any, Optional[PolicyRules]] = (None, None)
+        self._build_id: Optional[str] = None
+        self._load_seconds = 0.0
+        self._loads = 0
+        self._queries = 0
+        self._query_total_s = 0.0
+        self._query_last_s = 0.0
+        self._query_max_s = 0.0
+
+    def _load(self, rebuild: bool = False):
+        with self._lock:
+            t0 = time.perf_counter()
+            embedder = get_embedder()
+            if rebuild:
+                # Cached text/embeddings are kept, so a rebuild only re-indexes
+                for p in (MANIFEST_PATH, INDEX_PATH, META_PATH, BM25_PATH, RULES_PATH):
+                    p.unlink(missing_ok=True)
+            self._snapshot = build_or_load_index(embedder)
+            self._build_id = json.loads(MANIFEST_PATH.read_text(encoding="utf-8")).get("build_id")
+            with self._stats_lock:
+                self._load_seconds = time.perf_counter() - t0
+                self._loads += 1
+            return self._snapshot
+
+    def _ensure_loaded(self):
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                snap = self._snapshot
+                if snap is None:
+                    snap = self._load()
+        return snap
+
+    def reload(self):
+        """Re-read the index files from disk (e.g. after another process rebuilt them)."""
+        return self._load()
 
-    # Embed
-    embs = embedder.encode(chunks, normalize_embeddings=True, batch_size=64, show_progress_bar=False)
-    embs = np.array(embs, dtype="float32")
+    def rebuild(self):
+        """Delete the on-disk index, rebuild it and swap it in."""
+        return self._load(rebuild=True)
 
-    # Index (cosine similarity via inner product on normalized vectors)
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embs)
+    def sync(self) -> Dict[str, List[str]]:
+        """
+        Incrementally apply added/changed/removed policy files. Works on a
+        copy of the live index so concurrent searches are never disturbed.
+        """
+        with self._lock:
+            if self._snapshot is None:
+                self._load()
+                return {"added": [], "updated": [], "removed": [], "unchanged": [], "touched": []}
+            index, meta, embedder, bm25 = self._snapshot
+            stored = _load_store()
+            manifest = stored[3] if stored else _empty_manifest()
+            if stored is None:
+                index, meta, bm25 = None, ChunkMetaStore.empty(), BM25Index.empty()
+            else:
+                # Metadata and BM25 are never mutated in place, only the FAISS index
+                index = faiss.clone_index(index)
+            index, meta, bm25, manifest, summary = sync_index(embedder, index, meta, bm25, manifest)
+            meta = _persist_sync(index, meta, bm25, manifest, summary, force=stored is None)
+            self._snapshot = (index, meta, embedder, bm25)
+            self._build_id = manifest.get("build_id")
+            return summary
 
-    faiss.write_index(index, str(INDEX_PATH))
-    np.save(str(META_PATH), np.array(chunks_meta, dtype=object))
+    @staticmethod
+    def _hits(meta: ChunkMetaStore, ranked: List[Tuple[int, float, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        results = []
+        for vid, score, extra in ranked:
+            m = meta.get(vid)
+            if m is None:
+                continue
+            results.append({
+                "rank": len(results) + 1,
+                "score": score,
+                **extra,
+                "chunk_id": m["chunk_id"],
+                "source": m["source"],
+                "page_start": m["page_start"],
+                "page_end": m["page_end"],
+                "text": m["text"],
+            })
+        return results
 
-    return index, chunks_meta, embedder
+    @staticmethod
+    def _rrf(dense: List[Tuple[int, float]], lexical: List[Tuple[int, float]], k: int):
+        """Reciprocal-rank fusion of the dense and BM25 candidate lists."""
+        fused: Dict[int, float] = {}
+        dense_scores = dict(dense)
+        lexical_scores = dict(lexical)
+        for hits in (dense, lexical):
+            for rank, (vid, _) in enumerate(hits, start=1):
+                fused[vid] = fused.get(vid, 0.0) + 1.0 / (RRF_K + rank)
+        order = sorted(fused, key=lambda v: (-fused[v], -dense_scores.get(v, -1.0)))[:k]
+        return [
+            (vid, fused[vid], {"dense_score": dense_scores.get(vid), "bm25_score": lexical_scores.get(vid)})
+            for vid in order
+        ]
+
+    def _ids_for_sources(self, meta: ChunkMetaStore, sources) -> np.ndarray:
+        built_from, by_source = self._source_ids
+        if built_from is not meta:
+            by_source = meta.ids_by_source()
+            self._source_ids = (meta, by_source)
+        parts = [by_source[s] for s in sources if s in by_source]
+        return np.concatenate(parts) if parts else np.empty(0, dtype="int64")
+
+    def build_id(self) -> Optional[str]:
+        """ID of the current index build; changes when the index is rebuilt from scratch."""
+        self._ensure_loaded()
+        return self._build_id
+
+    def _rules_for(self, meta: ChunkMetaStore) -> PolicyRules:
+        built_from, rules = self._rules
+        if built_from is not meta:
+            rules = PolicyRules.open(RULES_PATH)
+            if rules is None:
+                rules = PolicyRules.from_chunks(meta)
+            self._rules = (meta, rules)
+        return rules
+
+    def rules(self, sources: Optional[List[str]] = None) -> PolicyRules:
+        """Policy rule table for the live snapshot, optionally limited to `sources`."""
+        return self._rules_for(self._ensure_loaded()[1]).for_sources(sources)
+
+    def search(self, query: str, k: int = 5, sources: Optional[List[str]] = None, **tuning) -> List[Dict[str, Any]]:
+        return self.search_many([query], k, sources=sources, **tuning)[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        batch_size: int = 64,
+        sources: Optional[List[str]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        hybrid: Optional[bool] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Embed all queries in batched encode calls and run one index.search
+        over the stacked matrix. Returns one result list per query, in order.
+        If `sources` is given, only chunks from those policy files are
+        searched (ID selector inside FAISS), so each query still gets up to
+        k hits from the allowed sources. nprobe/ef_search tune IVF/HNSW
+        indexes per call (see policy_index for the defaults).
+
+        In hybrid mode (POLICY_HYBRID, on by default) the dense and BM25
+        top candidates are fused with reciprocal-rank fusion; "score" is
+        then the fused score and dense_score/bm25_score are kept alongside.
+        """
+        if not queries:
+            return []
+        index, meta, embedder, bm25 = self._ensure_loaded()
+        hybrid = HYBRID if hybrid is None else hybrid
+        n_cand = max(k, HYBRID_CANDIDATES) if hybrid else k
+
+        sel = None
+        allowed = None
+        if sources is not None:
+            allowed = self._ids_for_sources(meta, sources)
+            if allowed.size == 0:
+                return [[] for _ in queries]
+            if allowed.size < len(meta):
+                sel = faiss.IDSelectorBatch(allowed)
+            else:
+                allowed = None
+        params = search_params(index, sel, nprobe=nprobe, ef_search=ef_search)
+
+        t0 = time.perf_counter()
+        with span("embed_query"):
+            q = embedder.encode(list(queries), normalize_embeddings=True, batch_size=batch_size, show_progress_bar=False)
+            q = np.ascontiguousarray(q, dtype="float32")
+        with span("vector_search"):
+            scores, ids = index.search(q, n_cand, params=params)
+            results = []
+            for i, query in enumerate(queries):
+                dense = [(int(v), float(sc)) for v, sc in zip(ids[i], scores[i]) if v != -1]
+                if hybrid:
+                    ranked = self._rrf(dense, bm25.search(query, n_cand, allowed_ids=allowed), k)
+                else:
+                    ranked = [(vid, sc, {"dense_score": sc}) for vid, sc in dense[:k]]
+                results.append(self._hits(meta, ranked))
+        self._record_queries(time.perf_counter() - t0, len(queries))
+        return results
+
+    def _record_queries(self, seconds: float, n: int = 1):
+        # Batched calls are recorded as n queries sharing the batch wall time
+        per_query = seconds / n
+        with self._stats_lock:
+            self._queries += n
+            self._query_total_s += seconds
+            self._query_last_s = per_query
+            self._query_max_s = max(self._query_max_s, per_query)
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        # Rule rows of the current snapshot (compiled on first use after a load or sync)
+        rule_rows = len(self._rules_for(snap[1])) if snap else 0
+        with self._stats_lock:
+            n = self._queries
+            return {
+                "loaded": snap is not None,
+                "loads": self._loads,
+                "load_seconds": round(self._load_seconds, 3),
+                "chunks": len(snap[1]) if snap else 0,
+                "index_type": describe_index(snap[0]) if snap else INDEX_TYPE,
+                "rule_rows": rule_rows,
+                "queries": n,
+                "query_avg_ms": round(1000 * self._query_total_s / n, 2) if n else 0.0,
+                "query_last_ms": round(1000 * self._query_last_s, 2),
+                "query_max_ms": round(1000 * self._query_max_s, 2),
+            }
+
+
+_RETRIEVER: Optional[PolicyRetriever] = None
+_RETRIEVER_LOCK = threading.Lock()
+
+def get_retriever() -> PolicyRetriever:
+    """Process-wide PolicyRetriever singleton."""
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER is None:
+                _RETRIEVER = PolicyRetriever()
+    return _RETRIEVER
 
 def rebuild_index():
-    # Delete old index files and rebuild
-    if INDEX_PATH.exists():
-        INDEX_PATH.unlink()
-    if META_PATH.exists():
-        META_PATH.unlink()
-    return build_or_load_index()
-
-def retrieve(query: str, k: int = 5) -> List[Dict[str, Any]]:
-    index, meta, embedder = build_or_load_index()
-    q = embedder.encode([query], normalize_embeddings=True)
-    q = np.array(q, dtype="float32")
+    # Delete old index files, rebuild and swap into the shared retriever
+    return get_retriever().rebuild()
+
+def sync_policies() -> Dict[str, List[str]]:
+    # Re-index only the policy files that were added, changed or removed
+    return get_retriever().sync()
+
+def index_build_id() -> Optional[str]:
+    return get_retriever().build_id()
+
+def policy_rules(sources: Optional[List[str]] = None) -> PolicyRules:
+    # Structured band/rate tables for deciding covered customers without the LLM
+    return get_retriever().rules(sources)
+
+def retrieve(query: str, k: int = 5, sources: Optional[List[str]] = None, **tuning) -> List[Dict[str, Any]]:
     # # Prefer diversity across sources: keep best 3 from risk policy, best 2 from rate policy
     # risk = [r for r in results if "Overall Risk" in r["source"]][:3]
     # rate = [r for r in results if "Interest Rate" in r["source"]][:2]
     # results = risk + rate
+    return get_retriever().search(query, k, sources=sources, **tuning)
 
-    scores, ids = index.search(q, k)
-    results = []
-    for rank, idx in enumerate(ids[0]):
-        if idx == -1:
-            continue
-        m = meta[idx]
-        results.append({
-            "rank": rank + 1,
-            "score": float(scores[0][rank]),
-            "chunk_id": m["chunk_id"],
-            "source": m["source"],
-            "text": m["text"],
-        })
-    return results
+def retrieve_many(
+    queries: List[str],
+    k: int = 5,
+    sources: Optional[List[str]] = None,
+    **tuning,
+) -> List[List[Dict[str, Any]]]:
+    """Batched retrieve(): one result list (same dict shape) per query."""
+    return get_retriever().search_many(queries, k, sources=sources, **tuning)
@@ -0,0 +1,116 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+RISK_LEVELS = ("low", "medium", "high")
+
+# "300 – 674 Delinquent High" (credit score band, account status, overall risk)
+_RISK_ROW_RE = re.compile(r"^(\d{3})\s*[-–—]\s*(\d{3})\s+([A-Za-z][A-Za-z \-]*?)\s+(Low|Medium|High)$", re.I)
+# "Medium 4.885 %" (overall risk, interest rate)
+_RATE_ROW_RE = re.compile(r"^(Low|Medium|High)\s+(\d+(?:\.\d+)?)\s*%$", re.I)
+
+
+def _norm_status(s: str) -> str:
+    return re.sub(r"[\s_]+", "-", (s or "").strip().lower())
+
+
+class PolicyRules:
+    """
+    Band -> risk -> rate tables compiled from the indexed policy chunks.
+    - risk rows: credit score band + account status -> overall risk
+    - rate rows: overall risk -> interest rate
+    Every row keeps the chunk_id it was read from, so a decision made from
+    the table cites the same evidence the LLM would have been shown.
+    """
+
+    def __init__(self, risk_rows: List[Dict[str, Any]], rate_rows: List[Dict[str, Any]]):
+        self.risk_rows = risk_rows
+        self.rate_rows = rate_rows
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Dict[str, Any]]) -> "PolicyRules":
+        """Scan chunk texts line by line for table rows (overlapping chunks are deduplicated)."""
+        risk_rows, rate_rows = {}, {}
+        for ch in chunks:
+            for line in ch["text"].split("\n"):
+                line = line.strip()
+                m = _RISK_ROW_RE.match(line)
+                if m:
+                    lo, hi, status, risk = m.groups()
+                    key = (ch["source"], int(lo), int(hi), _norm_status(status))
+                    risk_rows.setdefault(key, {
+                        "score_min": int(lo), "score_max": int(hi), "account_status": _norm_status(status),
+                        "overall_risk": risk.lower(), "chunk_id": ch["chunk_id"], "source": ch["source"],
+                    })
+                    continue
+                m = _RATE_ROW_RE.match(line)
+                if m:
+                    risk, rate = m.groups()
+                    rate_rows.setdefault((ch["source"], risk.lower()), {
+                        "overall_risk": risk.lower(), "interest_rate": float(rate),
+                        "chunk_id": ch["chunk_id"], "source": ch["source"],
+                    })
+        return cls(list(risk_rows.values()), list(rate_rows.values()))
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["PolicyRules"]:
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(data["risk_rows"], data["rate_rows"])
+
+    def save(self, path: Path):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"risk_rows": self.risk_rows, "rate_rows": self.rate_rows}, indent=2),
+                       encoding="utf-8")
+        os.replace(tmp, path)
+
+    def __len__(self) -> int:
+        return len(self.risk_rows) + len(self.rate_rows)
+
+    def for_sources(self, sources: Optional[List[str]]) -> "PolicyRules":
+        if sources is None:
+            return self
+        keep = set(sources)
+        return PolicyRules([r for r in self.risk_rows if r["source"] in keep],
+                           [r for r in self.rate_rows if r["source"] in keep])
+
+    def decide(self, customer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Overall risk + interest rate for a customer straight from the tables,
+        or None if the tables don't cover them (score outside every band,
+        unknown account status, or no rate for the resulting risk).
+        Overlapping rows resolve to the higher risk/rate ("be conservative").
+        """
+        try:
+            score = int(customer.get("credit_score"))
+        except (TypeError, ValueError):
+            return None
+        status = _norm_status(customer.get("account_status"))
+
+        risk_hits = [r for r in self.risk_rows
+                     if r["account_status"] == status and r["score_min"] <= score <= r["score_max"]]
+        if not risk_hits:
+            return None
+        risk_row = max(risk_hits, key=lambda r: RISK_LEVELS.index(r["overall_risk"]))
+        risk = risk_row["overall_risk"]
+
+        rate_hits = [r for r in self.rate_rows if r["overall_risk"] == risk]
+        if not rate_hits:
+            return None
+        rate_row = max(rate_hits, key=lambda r: r["interest_rate"])
+        rate = f"{rate_row['interest_rate']:g}%"
+
+        return {
+            "overall_risk": risk,
+            "interest_rate": rate,
+            "evidence_used": [
+                {"chunk_id": risk_row["chunk_id"],
+                 "why_used": f"Credit score {risk_row['score_min']}-{risk_row['score_max']} with "
+                             f"{risk_row['account_status']} account status -> {risk} overall risk"},
+                {"chunk_id": rate_row["chunk_id"],
+                 "why_used": f"{risk.capitalize()} overall risk -> {rate} interest rate"},
+            ],
+        }
@@ -0,0 +1,78 @@
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+from llm_executor import estimate_tokens
+
+# Upper bound on the estimated prompt size; evidence gets what the fixed part leaves
+PROMPT_TOKEN_BUDGET = int(os.getenv("GEMINI_PROMPT_TOKEN_BUDGET", "1500"))
+
+# Customer fields the decision depends on; name, email and ID never reach the model
+PROMPT_FIELDS = ("credit_score", "account_status", "nationality", "pr_status")
+
+TASK = "Assess overall risk level and interest rate, and produce rationale grounded in evidence. Reply with JSON only:"
+OUTPUT_SPEC = (
+    '{"overall_risk":"low|medium|high|unknown","interest_rate":"<percent>|unknown",'
+    '"recommendation":"approve|do_not_recommend|needs_manual_review","rationale":"...",'
+    '"evidence_used":[{"chunk_id":"...","why_used":"..."}],"assumptions_or_gaps":["..."]}'
+)
+
+
+def prompt_customer(customer: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: customer[k] for k in PROMPT_FIELDS if k in customer}
+
+
+def pack_evidence(evidence: List[Dict[str, Any]], budget_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Evidence chunks in retrieval order (most relevant first), trimmed to
+    `budget_tokens`. Lines are whitespace-normalised and each distinct
+    line is kept once, so the overlap between adjacent chunks (and table
+    rows that several chunks repeat) is only paid for once. Packing stops
+    at the first line that doesn't fit.
+    """
+    seen = set()
+    packed = []
+    used = 0
+    stats = {"chunks_in": len(evidence), "duplicate_lines": 0, "dropped_lines": 0}
+    full = False
+    for e in evidence:
+        lines = []
+        header = estimate_tokens(e["chunk_id"])
+        for raw in (e.get("text") or "").splitlines():
+            line = " ".join(raw.split())
+            if not line:
+                continue
+            if full:
+                stats["dropped_lines"] += 1
+                continue
+            key = line.lower()
+            if key in seen:
+                stats["duplicate_lines"] += 1
+                continue
+            cost = estimate_tokens(line) + (0 if lines else header)
+            if used + cost > budget_tokens:
+                full = True
+                stats["dropped_lines"] += 1
+                continue
+            seen.add(key)
+            lines.append(line)
+            used += cost
+        if lines:
+            packed.append({"chunk_id": e["chunk_id"], "text": "\n".join(lines)})
+    stats["chunks_out"] = len(packed)
+    return packed, stats
+
+
+def build_prompt(customer: Dict[str, Any], evidence: List[Dict[str, Any]],
+                 budget_tokens: int = PROMPT_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    Decision prompt for one customer. Returns the prompt "text" plus the
+    "customer" fields and packed "evidence" it was built from (the content
+    a cached decision depends on) and packing "stats".
+    """
+    fields = prompt_customer(customer)
+    head = f"{TASK}\n{OUTPUT_SPEC}\nCustomer: {json.dumps(fields)}\nPolicy evidence:\n"
+    packed, stats = pack_evidence(evidence, budget_tokens - estimate_tokens(head))
+    text = head + "\n\n".join(f"[{p['chunk_id']}]\n{p['text']}" for p in packed)
+    stats["prompt_tokens_est"] = estimate_tokens(text)
+    return {"text": text, "customer": fields, "evidence": packed, "stats": stats}
@@ -0,0 +1,208 @@
+"""
+Bulk rendering of decision notes and applicant letters (e.g. month-end mailings).
+
+Input is a stream of (customer, result) records: JSONL lines with
+"customer" and "result" keys, which is the shape of the audit log records
+written by the app and batch_assess.py. Only the latest record per
+customer is rendered. Records are split into batches and rendered across
+a process pool; batches are written in input order.
+
+Output formats:
+  zip  one archive with notes/decision_note_<id>.txt,
+       letters/applicant_letter_<id>.txt and letters/applicant_letter_<id>.pdf
+  pdf  one merged PDF of applicant letters per batch
+       (<out>/letters_00001.pdf, ...), with a bookmark per customer
+
+Usage:
+  python render_correspondence.py                                  # everything in the audit log
+  python render_correspondence.py --results customers.results.jsonl --format pdf
+  python render_correspondence.py records.jsonl -o mailing.zip --workers 8 --batch-size 500
+"""
+import argparse
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from applicant_letter_generator import build_applicant_letter
+from audit_logger import AUDIT_DIR, iter_audit_records
+from decision_note import build_decision_note
+from pdf_utils import LETTER_PDF_TITLE, letter_text_to_pdf_bytes, letters_to_pdf_bytes
+from policy_chunker import batched
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+RENDER_BATCH_SIZE = 200
+
+Record = Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]  # customer, result, evidence
+
+
+def _iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _source(path: Optional[Path]) -> Iterator[Dict[str, Any]]:
+    return iter_audit_records(AUDIT_DIR) if path is None else _iter_jsonl(path)
+
+
+def iter_records(path: Optional[Path] = None, audit_ids: Optional[Set[str]] = None) -> Iterator[Record]:
+    """
+    (customer, result, evidence) from a JSONL file, or from the audit log
+    when no path is given. With audit_ids, only those audit records.
+    A customer assessed more than once only gets their latest decision
+    (by timestamp, then position), so no outdated letter goes out. The
+    input is read twice, to keep memory flat.
+    """
+    def usable(recs):
+        for i, rec in enumerate(recs):
+            if audit_ids is not None and rec.get("audit_id") not in audit_ids:
+                continue
+            customer, result = rec.get("customer"), rec.get("result") or rec.get("decision")
+            if customer and result:
+                yield i, rec, customer, result
+
+    # Records are matched between the passes by audit_id (position for other JSONL),
+    # since the live audit log can gain lines in between
+    latest: Dict[Any, Tuple[str, int, Any]] = {}
+    for i, rec, customer, _ in usable(_source(path)):
+        cid = customer.get("id", ("row", i))
+        mark = (str(rec.get("timestamp") or ""), i, rec.get("audit_id") or i)
+        if cid not in latest or mark[:2] >= latest[cid][:2]:
+            latest[cid] = mark
+    keep = {key for _, _, key in latest.values()}
+
+    for i, rec, customer, result in usable(_source(path)):
+        if (rec.get("audit_id") or i) in keep:
+            yield customer, result, rec.get("evidence") or []
+
+
+def batch_audit_ids(results_path: Path) -> Set[str]:
+    """Audit IDs of the successful customers in a batch_assess.py results file."""
+    ids = set()
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            audit_id = (rec.get("outputs") or {}).get("audit_id")
+            if rec.get("status") == "ok" and audit_id:
+                ids.add(audit_id)
+    return ids
+
+
+def render_files(customer: Dict[str, Any], result: Dict[str, Any], evidence: List[Dict[str, Any]],
+                 pdf: bool = True) -> List[Tuple[str, bytes]]:
+    """The correspondence for one customer, as (archive name, bytes) pairs."""
+    cid = customer.get("id")
+    letter = build_applicant_letter(customer, result)
+    files = [
+        (f"notes/decision_note_{cid}.txt", build_decision_note(customer, result, evidence).encode("utf-8")),
+        (f"letters/applicant_letter_{cid}.txt", letter.encode("utf-8")),
+    ]
+    if pdf:
+        files.append((f"letters/applicant_letter_{cid}.pdf", letter_text_to_pdf_bytes(letter, title=LETTER_PDF_TITLE)))
+    return files
+
+
+def _render_zip_batch(args: Tuple[List[Record], bool]) -> List[Tuple[str, bytes]]:
+    batch, pdf = args
+    files = []
+    for customer, result, evidence in batch:
+        files.extend(render_files(customer, result, evidence, pdf=pdf))
+    return files
+
+
+def _render_pdf_batch(batch: List[Record]) -> bytes:
+    letters = (
+        (f"{c.get('name') or 'Customer'} (ID {c.get('id')})", build_applicant_letter(c, r))
+        for c, r, _ in batch
+    )
+    return letters_to_pdf_bytes(letters, title=LETTER_PDF_TITLE)
+
+
+def _render_ordered(fn, tasks: Iterable, workers: int) -> Iterator:
+    """fn over tasks, in order. At most 2 * workers tasks are in flight, so input is streamed."""
+    if workers <= 1:
+        for t in tasks:
+            yield fn(t)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        inflight = deque()
+        for t in tasks:
+            inflight.append(ex.submit(fn, t))
+            if len(inflight) >= 2 * workers:
+                yield inflight.popleft().result()
+        while inflight:
+            yield inflight.popleft().result()
+
+
+def render_zip(records: Iterable[Record], out_path: Path, workers: int = RENDER_WORKERS,
+               batch_size: int = RENDER_BATCH_SIZE, pdf: bool = True) -> int:
+    """Write every record's note and letter (txt, and PDF unless pdf=False) to one zip; returns the customer count."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tasks = ((b, pdf) for b in batched(records, batch_size))
+    n = 0
+    with zipfile.ZipFile(out_path, "w") as zf:
+        for files in _render_ordered(_render_zip_batch, tasks, workers):
+            for name, data in files:
+                # PDFs are compressed already; only deflate the text
+                zf.writestr(name, data, compress_type=zipfile.ZIP_STORED if name.endswith(".pdf") else zipfile.ZIP_DEFLATED)
+                n += name.startswith("notes/")
+    return n
+
+
+def render_merged_pdfs(records: Iterable[Record], out_dir: Path, workers: int = RENDER_WORKERS,
+                       batch_size: int = RENDER_BATCH_SIZE) -> List[Path]:
+    """Write one bookmarked PDF of applicant letters per batch of records; returns the files written."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, pdf_bytes in enumerate(_render_ordered(_render_pdf_batch, batched(records, batch_size), workers), 1):
+        path = out_dir / f"letters_{i:05d}.pdf"
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(pdf_bytes)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", nargs="?", type=Path, help="JSONL of {customer, result} records (default: the audit log)")
+    ap.add_argument("--results", type=Path, help="only the customers of this batch_assess.py results file")
+    ap.add_argument("--format", choices=("zip", "pdf"), default="zip")
+    ap.add_argument("-o", "--output", type=Path, help="zip file or PDF directory (default: batch_output/correspondence[.zip])")
+    ap.add_argument("--workers", type=int, default=RENDER_WORKERS, help="rendering processes")
+    ap.add_argument("--batch-size", type=int, default=RENDER_BATCH_SIZE, help="customers per task (and per merged PDF)")
+    ap.add_argument("--no-pdf", action="store_true", help="zip format: text files only")
+    args = ap.parse_args()
+
+    audit_ids = batch_audit_ids(args.results) if args.results else None
+    count = [0]
+
+    def records():
+        for rec in iter_records(args.input, audit_ids):
+            count[0] += 1
+            yield rec
+
+    t0 = time.perf_counter()
+    if args.format == "zip":
+        out = args.output or Path("batch_output") / "correspondence.zip"
+        render_zip(records(), out, args.workers, args.batch_size, pdf=not args.no_pdf)
+        print(f"Wrote correspondence for {count[0]} customers to {out}")
+    else:
+        out = args.output or Path("batch_output") / "correspondence"
+        paths = render_merged_pdfs(records(), out, args.workers, args.batch_size)
+        print(f"Wrote {count[0]} letters in {len(paths)} merged PDF(s) to {out}")
+    elapsed = time.perf_counter() - t0
+    print(f"{elapsed:.1f}s ({count[0] / max(elapsed, 1e-9) * 60:,.0f} customers/min)")
+
+
+if __name__ == "__main__":
+    main()